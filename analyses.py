@@ -0,0 +1,230 @@
+import json
+import os
+
+import numpy as np
+
+from dcsweep import dc_sweep, iter_dc_sweep, sweep_values
+from mna import impedance_matrix, sweep_frequencies
+from mor import MacromodelCache
+from noise import noise
+from pz import pole_zero
+from resultstore import result_store
+from sensitivity import sensitivities
+
+# Analyses requested by spice directives in the netlist
+# each handler gets the circuit, its stamped MNA system and the directive tokens
+
+
+def _fmt(val):
+    if np.iscomplexobj(val):
+        return '{:.4g}{:+.4g}j'.format(val.real, val.imag)
+    return '{:.4g}'.format(val)
+
+
+def run_sens(ckt, system, tk):
+    """.sens <output> [<output> ...] [ac dec|oct|lin <points> <fstart> <fstop>]"""
+    outputs, rest = [], tk[1:]
+    while rest and rest[0] not in ('ac', 'dc'):
+        outputs.append(rest.pop(0))
+    if not outputs:
+        raise ValueError('.sens needs at least one output, e.g. .sens v(3)')
+    freqs = None
+    if rest and rest[0] == 'ac':
+        freqs = sweep_frequencies(*rest[1:5])
+
+    res = sensitivities(ckt, outputs, freqs, system)
+    rel = res.normalized()
+    print('Sensitivity analysis')
+    for f in range(len(res.y)):
+        for k, out in enumerate(res.outputs):
+            where = 'DC' if res.freqs is None else '{:.4g} Hz'.format(res.freqs[f])
+            print('{:s} at {:s} = {:s}'.format(out.upper(), where, _fmt(res.y[f, k])))
+            print('{:>10s} {:>12s} {:>22s} {:>22s}'.format('element', 'value', 'dy/dp', '(p/y)*dy/dp'))
+            for j, name in enumerate(res.params):
+                print('{:>10s} {:>12.4g} {:>22s} {:>22s}'.format(
+                    name, res.values[j], _fmt(res.dy[f, j, k]), _fmt(rel[f, j, k])))
+    return res
+
+
+def run_pz(ckt, system, tk):
+    """.pz <source> <output> [dense|sparse [<number of poles> [<shift>]]]"""
+    if len(tk) < 3:
+        raise ValueError('.pz needs an input source and an output, e.g. .pz v1 v(3)')
+    method = tk[3] if len(tk) > 3 else None
+    k = int(tk[4]) if len(tk) > 4 else 6
+    sigma = float(tk[5]) if len(tk) > 5 else 0.0
+    res = pole_zero(system, tk[1], tk[2], method, k, sigma)
+    print('Pole-zero analysis, {:s} to {:s}'.format(tk[1].upper(), tk[2].upper()))
+    print('poles:')
+    for p in res.poles:
+        print('  {:s}'.format(_fmt(p)))
+    print('zeros:')
+    for z in res.zeros:
+        print('  {:s}'.format(_fmt(z)))
+    if len(res.hidden):
+        # cancelled or unreachable, left out of the stability verdict
+        print('hidden poles: {:s}'.format(' '.join(_fmt(p) for p in res.hidden)))
+    if res.unstable:
+        print('stability: unstable')
+    elif res.marginal:
+        print('stability: marginally stable')
+    else:
+        print('stability: stable')
+    if res.dominant is not None:
+        print('dominant pole: {:s}'.format(_fmt(res.dominant)))
+    return res
+
+
+def run_mor(ckt, system, tk):
+    """.mor <port node> [<port node> ...] [moments <q>] [tol <error>] [fmax <Hz>]"""
+    ports, opts, rest = [], {}, tk[1:]
+    while rest and rest[0] not in ('moments', 'tol', 'fmax'):
+        ports.append(int(rest.pop(0)))
+    while len(rest) >= 2:
+        opts[rest[0]] = rest[1]
+        rest = rest[2:]
+    if not ports:
+        raise ValueError('.mor needs at least one port node, e.g. .mor 1 5')
+    cache = MacromodelCache(os.getenv('MOR_CACHE_DIR', 'mor_cache'))
+    model, hit = cache.get(ckt, ports,
+                           moments=int(opts['moments']) if 'moments' in opts else None,
+                           tol=float(opts['tol']) if 'tol' in opts else None,
+                           fmax=float(opts.get('fmax', 1e9)))
+    print('Model order reduction (PRIMA), ports {}'.format(' '.join(str(p) for p in ports)))
+    print('full size: {:d}, reduced size: {:d} ({:.0f}x smaller)'.format(
+        model.full_size, model.size, model.full_size / model.size))
+    print('expansion point s0: {:.4g}'.format(model.s0))
+    print('max relative error up to {:.4g} Hz: {:.3g}'.format(float(opts.get('fmax', 1e9)), model.error))
+    print('macromodel: {:s}'.format('cached' if hit else 'new'))
+    if not model.converged:
+        print('warning: tolerance {:.3g} not met, the model error is {:.3g}'.format(model.tol, model.error))
+    return model
+
+
+def run_dc(ckt, system, tk):
+    """.dc <element> <start> <stop> <step> [<element> <start> <stop> <step>]"""
+    if len(tk) not in (5, 9):
+        raise ValueError('.dc needs an element with start, stop and step, e.g. .dc v1 0 5 0.1')
+    sweeps = [(tk[i], sweep_values(*tk[i + 1:i + 4])) for i in range(1, len(tk), 4)]
+    store = result_store()
+    if store is not None:
+        # chunks go to the result store as they are solved
+        writer = None
+        for res in iter_dc_sweep(ckt, sweeps, system):
+            if writer is None:
+                cols = [(p, float) for p in res.params] + [(nm, res.X.dtype) for nm in res.names]
+                writer = store.create(cols, index=res.params[0], analysis='dc')
+            writer.append(res.columns())
+        writer.close()
+        print('DC sweep of {:s}, {:d} points'.format(' and '.join(res.params), writer.rows))
+        print('results: dc {:s}'.format(writer.run_id))
+        return writer.run_id
+    res = dc_sweep(ckt, sweeps, system)
+    print('DC sweep of {:s}, {:d} points'.format(' and '.join(res.params), len(res)))
+    # one line of columns instead of a line per point
+    print(json.dumps({k: v.tolist() for k, v in res.columns().items()}, separators=(',', ':')))
+    return res
+
+
+def run_noise(ckt, system, tk):
+    """.noise <output> <input source> dec|oct|lin <points> <fstart> <fstop>
+
+    Controlled sources get noise from .noisespec <element> <density> [<1/f corner>]
+    lines, the density in V/sqrt(Hz) (E, H) or A/sqrt(Hz) (G, F).
+    """
+    if len(tk) != 7:
+        raise ValueError('.noise needs an output, an input source and a sweep, e.g. .noise v(3) v1 dec 10 1 1e6')
+    specs = {}
+    for d in ckt.directives:
+        if d[0] == '.noisespec':
+            specs[d[1]] = (float(d[2]), float(d[3]) if len(d) > 3 else 0.0)
+    freqs = sweep_frequencies(*tk[3:7])
+    res = noise(ckt, tk[1], tk[2], freqs, specs, system)
+    out_unit = 'A' if tk[1][0] == 'i' else 'V'
+    in_unit = 'A' if res.source[0] == 'I' else 'V'
+
+    print('Noise analysis, {:s} referred to {:s}'.format(tk[1].upper(), res.source))
+    store = result_store()
+    if store is not None:
+        # power spectral densities (unit^2/Hz), unlike the printed onoise/inoise in unit/rtHz
+        cols = ['freq', 'onoise_psd', 'inoise_psd'] + [nm + '_psd' for nm in res.names]
+        units = {'onoise_psd': out_unit + '^2/Hz', 'inoise_psd': in_unit + '^2/Hz'}
+        with store.create([(c, float) for c in cols], index='freq', analysis='noise',
+                          attrs={'units': units}) as w:
+            w.append(dict(zip(cols, [res.freqs, res.output_psd, res.input_psd] + list(res.psd.T))))
+        print('results: noise {:s}'.format(w.run_id))
+    else:
+        print('{:>12s} {:>16s} {:>16s}'.format('frequency', 'onoise {}/rtHz'.format(out_unit),
+                                              'inoise {}/rtHz'.format(in_unit)))
+        for f, o, i in zip(res.freqs, res.output_psd, res.input_psd):
+            print('{:>12.4g} {:>16.4g} {:>16.4g}'.format(f, np.sqrt(o), np.sqrt(i)))
+    total, parts = res.integrated()
+    print('total output noise {:.4g} to {:.4g} Hz: {:.4g} {:s} rms'.format(
+        res.freqs[0], res.freqs[-1], np.sqrt(total), out_unit))
+    print('total input referred noise: {:.4g} {:s} rms'.format(np.sqrt(res.integrated_input()), in_unit))
+    print('{:>10s} {:>14s} {:>8s}'.format('element', out_unit + ' rms', 'share'))
+    for k in np.argsort(parts)[::-1]:
+        print('{:>10s} {:>14.4g} {:>7.1f}%'.format(res.names[k], np.sqrt(parts[k]),
+                                                   100 * parts[k] / total if total > 0 else 0.0))
+    return res
+
+
+def run_zparams(ckt, system, tk):
+    """.zparams <p node> <n node> [<p node> <n node> ...] [freq <Hz>]"""
+    args, freq = tk[1:], 0.0
+    if 'freq' in args:
+        k = args.index('freq')
+        if k != len(args) - 2:
+            raise ValueError('.zparams freq takes one frequency at the end, e.g. .zparams 1 0 freq 1e6')
+        freq = float(args[k + 1])
+        args = args[:k]
+    if not args or len(args) % 2:
+        raise ValueError('.zparams needs node pairs, e.g. .zparams 1 0 2 0')
+    nodes = [int(a) for a in args]
+    for nd in nodes:
+        if not 0 <= nd <= ckt.num_nodes:
+            raise ValueError('.zparams port refers to unknown node {:d}'.format(nd))
+    ports = list(zip(nodes[::2], nodes[1::2]))
+    Z = impedance_matrix(system.A(2j * np.pi * freq), ports)
+    print('Z parameters at {:s}'.format('DC' if not freq else '{:.4g} Hz'.format(freq)))
+    for j, (p, q) in enumerate(ports):
+        print('{:>10s} '.format('({:d},{:d})'.format(p, q)) + ' '.join('{:>22s}'.format(_fmt(z)) for z in Z[j]))
+    return Z
+
+
+ANALYSES = {
+    '.dc': run_dc,
+    '.sens': run_sens,
+    '.pz': run_pz,
+    '.mor': run_mor,
+    '.noise': run_noise,
+    '.zparams': run_zparams,
+}
+
+
+# problems a malformed directive can raise: bad or missing arguments, unknown
+# nodes or sources, singular matrices (scipy's splu raises RuntimeError)
+DIRECTIVE_ERRORS = (ValueError, TypeError, IndexError, KeyError, RuntimeError, np.linalg.LinAlgError)
+
+
+def run_directives(ckt, system=None):
+    """Run every analysis directive in the netlist, others such as .op are skipped.
+
+    A directive that fails prints one error line and the others still run,
+    its result is None.
+    """
+    results = []
+    for tk in ckt.directives:
+        handler = ANALYSES.get(tk[0])
+        if handler is None:
+            continue
+        if system is None:
+            system = ckt.stamp()
+        try:
+            res = handler(ckt, system, tk)
+        except DIRECTIVE_ERRORS as e:
+            msg = e.args[0] if isinstance(e, KeyError) and e.args else e
+            print('error: {:s} failed: {}'.format(' '.join(tk), msg))
+            res = None
+        results.append((tk[0], res))
+    return results
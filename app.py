@@ -1,14 +1,25 @@
-from flask import Flask, request, jsonify
-from graphviz import Digraph
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask import send_from_directory
 import os
+import io
+import runpy
+import signal
+import threading
+import contextlib
 import subprocess
 import tempfile
 import sys
 from pathlib import Path
 import logging
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import json
+from collections import defaultdict
 from flask_cors import CORS
+from diagram import DiagramRenderer, FORMATS, KEEP_DIAGRAMS, MAX_AGE as DIAGRAM_MAX_AGE, netlist_edges, topology_key
 
 app = Flask(__name__)
 # Enable CORS for all routes and origins
@@ -25,36 +36,127 @@ def favicon():
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_circuit_diagram(netlist_content):
-    """Generate a circuit diagram image from the netlist."""
-    diagram = Digraph(format='png')
-    diagram.attr('node', shape='circle')
+# DIAGRAMS_KEEP and DIAGRAMS_MAX_AGE bound the diagram cache like the result store
+diagrams = DiagramRenderer(keep=int(os.getenv('DIAGRAMS_KEEP', KEEP_DIAGRAMS)),
+                           max_age=float(os.getenv('DIAGRAMS_MAX_AGE', DIAGRAM_MAX_AGE)))
 
-    for line in netlist_content.split('\n'):
-        if not line.strip():
-            continue
-        tokens = line.split()
-        element, p_node, n_node = tokens[:3]
-        diagram.node(p_node)
-        diagram.node(n_node)
-        diagram.edge(p_node, n_node, label=element)
+def generate_circuit_diagram(netlist_content, fmt='png'):
+    """Queue a circuit diagram of the netlist, returns the URL it will be served from."""
+    return f'/diagrams/{diagrams.submit(netlist_content, fmt)}'
+
+SOLVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server2.py')
+
+# seconds one solve may run, SOLVER_TIMEOUT=0 turns the limit off
+SOLVER_TIMEOUT = float(os.getenv('SOLVER_TIMEOUT', '300'))
+# extra seconds before a pool worker that ignores its alarm (stuck in C code) is killed
+TIMEOUT_GRACE = 10
+
+class SolverTimeout(BaseException):
+    """Raised in a pool worker when its solve runs past the timeout.
+
+    A BaseException so the generic exception handlers of the solver do not catch it.
+    """
+
+def _alarm(signum, frame):
+    raise SolverTimeout()
+
+def _warm_worker():
+    """Import the solver dependencies once when a pool worker starts."""
+    import numpy, scipy.linalg, scipy.sparse, sympy, pandas  # noqa: F401
+    import circuit, mna  # noqa: F401
+
+def _run_solver(filepath, mode, timeout=0):
+    """Run server2.py inside a warm worker, returns (returncode, stdout, stderr)."""
+    os.environ['NETLIST_PATH'] = filepath
+    os.environ['ANALYSIS_MODE'] = mode
+    out, err = io.StringIO(), io.StringIO()
+    code = 0
+    if timeout:
+        # pool workers run jobs on their main thread, so the alarm interrupts the solve
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            runpy.run_path(SOLVER_SCRIPT, run_name='__main__')
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except SolverTimeout:
+            print(f'Solver timed out after {timeout:g} s', file=sys.stderr)
+            code = 1
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    return code, out.getvalue(), err.getvalue()
+
+class SolverPool:
+    """Pre-forked pool of solver workers with sympy, pandas and numpy already imported.
+
+    A worker that dies (e.g. killed for memory) breaks the executor, it is
+    replaced by a fresh one and only the jobs running at that time fail.
+    """
+
+    def __init__(self, size, timeout=SOLVER_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.executor = self._start()
+
+    def _start(self):
+        # fork so the workers start from this process's already imported modules
+        ctx = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        executor = ProcessPoolExecutor(max_workers=self.size, mp_context=ctx, initializer=_warm_worker)
+        # start every worker now instead of on the first request
+        for f in [executor.submit(os.getpid) for _ in range(self.size)]:
+            f.result()
+        return executor
+
+    def _restart(self, old):
+        with self.lock:
+            if self.executor is not old:
+                # another request already replaced it
+                return
+            # the executor has no public way to stop running workers
+            for p in list((getattr(old, '_processes', None) or {}).values()):
+                p.kill()
+            old.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._start()
+
+    def run(self, filepath, mode):
+        executor = self.executor
+        try:
+            future = executor.submit(_run_solver, filepath, mode, self.timeout)
+            return future.result(timeout=self.timeout + TIMEOUT_GRACE if self.timeout else None)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise Exception('Solver worker died, the worker pool was restarted')
+        except FutureTimeout:
+            self._restart(executor)
+            raise Exception(f'Solver timed out after {self.timeout:g} s, the worker pool was restarted')
+        except SolverTimeout:
+            # the alarm went off just as the solve finished
+            raise Exception(f'Solver timed out after {self.timeout:g} s')
 
-    # Save the diagram to the static folder
-    output_path = 'static/circuit_diagram'
-    diagram.render(output_path, cleanup=True)
-    return f'/static/circuit_diagram.png'
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 class NetlistProcessor:
-    def __init__(self, upload_folder="temp_netlists"):
+    def __init__(self, upload_folder="temp_netlists", pool_size=0):
         self.upload_folder = upload_folder
         Path(upload_folder).mkdir(parents=True, exist_ok=True)
+        self.pool = SolverPool(pool_size) if pool_size > 0 else None
 
-    
-    
-    def save_netlist(self, netlist_content, filename="temp_netlist.net"):
+    def save_netlist(self, netlist_content, filename=None):
         """Save the netlist content to a temporary file"""
         try:
-            filepath = os.path.join(self.upload_folder, filename)
+            if filename is None:
+                # unique name so concurrent requests never share a file
+                fd, filepath = tempfile.mkstemp(suffix='.net', dir=self.upload_folder)
+                os.close(fd)
+            else:
+                filepath = os.path.join(self.upload_folder, filename)
             with open(filepath, 'w') as f:
                 f.write(netlist_content)
             return filepath
@@ -62,24 +164,33 @@ class NetlistProcessor:
             logger.error(f"Error saving netlist: {str(e)}")
             raise
     
-    def process_netlist(self, filepath):
+    def process_netlist(self, filepath, mode='symbolic'):
         """Process the netlist using the existing server2.py script"""
         try:
-            # Capture the output of the script
-            result = subprocess.run(
-                [sys.executable, "server2.py"],
-                capture_output=True,
-                text=True,
-                env={**os.environ, 'NETLIST_PATH': filepath}
-            )
-            
-            if result.returncode != 0:
-                raise Exception(f"Script execution failed: {result.stderr}")
+            if self.pool is not None:
+                returncode, stdout, stderr = self.pool.run(filepath, mode)
+            else:
+                # Capture the output of the script
+                try:
+                    result = subprocess.run(
+                        [sys.executable, "server2.py"],
+                        capture_output=True,
+                        text=True,
+                        env={**os.environ, 'NETLIST_PATH': filepath, 'ANALYSIS_MODE': mode},
+                        timeout=SOLVER_TIMEOUT or None
+                    )
+                except subprocess.TimeoutExpired:
+                    raise Exception(f'Solver timed out after {SOLVER_TIMEOUT:g} s')
+                returncode, stdout, stderr = result.returncode, result.stdout, result.stderr
+
+            if returncode != 0:
+                raise Exception(f"Script execution failed: {stderr}")
             
             return {
-                'output': result.stdout,
-                'equations': self._parse_equations(result.stdout),
-                'matrices': self._parse_matrices(result.stdout)
+                'output': stdout,
+                'equations': self._parse_equations(stdout),
+                'matrices': self._parse_matrices(stdout),
+                'runs': self._parse_runs(stdout)
             }
         except Exception as e:
             logger.error(f"Error processing netlist: {str(e)}")
@@ -116,6 +227,15 @@ class NetlistProcessor:
             logger.error(f"Error parsing matrices: {str(e)}")
             return None
 
+    def _parse_runs(self, output):
+        """Result store runs written by the script, from its 'results: <analysis> <run id>' lines"""
+        runs = []
+        for line in output.split('\n'):
+            if line.startswith('results: '):
+                analysis, run_id = line.split()[1:3]
+                runs.append({'analysis': analysis, 'runId': run_id, 'url': f'/results/{run_id}'})
+        return runs
+
     def cleanup(self, filepath):
         """Clean up temporary files"""
         try:
@@ -124,7 +244,49 @@ class NetlistProcessor:
         except Exception as e:
             logger.error(f"Error cleaning up files: {str(e)}")
 
-processor = NetlistProcessor()
+# solvers write full precision results here, served by /results/<run id>
+os.environ.setdefault('RESULTS_DIR', 'results')
+
+# SOLVER_WORKERS > 0 keeps that many warm solver processes instead of a subprocess per request
+processor = NetlistProcessor(pool_size=int(os.getenv('SOLVER_WORKERS', '0')))
+
+ANALYSIS_MODES = ('symbolic', 'numeric', 'parallel')
+
+class PreflightError(Exception):
+    """The netlist failed the structural checks, diagnostics says where."""
+
+    def __init__(self, diagnostics):
+        super().__init__('Netlist rejected by preflight checks')
+        self.diagnostics = diagnostics
+
+def run_netlist(netlist_content, mode='symbolic', diagram_format='png'):
+    """Solve one netlist, the diagram is queued first so it renders during the solve."""
+    # reject structurally broken netlists before starting a solver
+    from preflight import preflight, has_errors
+    _, diags = preflight(netlist_content.split('\n'))
+    diagnostics = [d.as_dict() for d in diags]
+    if has_errors(diags):
+        raise PreflightError(diagnostics)
+
+    diagram_path = generate_circuit_diagram(netlist_content, diagram_format) if diagram_format else None
+
+    # Save the netlist to a temporary file
+    filepath = processor.save_netlist(netlist_content)
+    try:
+        # Process the netlist
+        result = processor.process_netlist(filepath, mode)
+    finally:
+        # Clean up
+        processor.cleanup(filepath)
+
+    return {
+        'status': 'success',
+        'results': result,
+        'diagnostics': diagnostics,  # preflight warnings
+        'circuitDiagram': diagram_path,  # Add diagram path to response
+        # 'pending' means GET circuitDiagram answers 202 until the drawing is done
+        'diagramStatus': diagrams.status(diagram_path.rsplit('/', 1)[1]) if diagram_path else None
+    }
 
 @app.route('/process-netlist', methods=['POST'])
 def process_netlist():
@@ -133,25 +295,21 @@ def process_netlist():
             return jsonify({'error': 'No netlist content provided'}), 400
 
         netlist_content = request.json['netlist']
-        
-        # Save the netlist to a temporary file
-        filepath = processor.save_netlist(netlist_content)
-        
-        # Process the netlist
-        result = processor.process_netlist(filepath)
+        mode = request.json.get('mode', 'symbolic')
+        if mode not in ANALYSIS_MODES:
+            return jsonify({'error': f'Unknown analysis mode: {mode}'}), 400
+        diagram_format = request.json.get('diagramFormat', 'png')
+        if diagram_format not in FORMATS:
+            return jsonify({'error': f'Unknown diagram format: {diagram_format}'}), 400
 
-         # Generate the circuit diagram
-        diagram_path = generate_circuit_diagram(netlist_content)
+        return jsonify(run_netlist(netlist_content, mode, diagram_format))
 
-        # Clean up
-        processor.cleanup(filepath)
-        
+    except PreflightError as e:
         return jsonify({
-            'status': 'success',
-            'results': result,
-            'circuitDiagram': diagram_path  # Add diagram path to response
-        })
-
+            'status': 'error',
+            'message': str(e),
+            'diagnostics': e.diagnostics
+        }), 422
     except Exception as e:
         logger.error(f"Error in process_netlist endpoint: {str(e)}\n{traceback.format_exc()}")
         return jsonify({
@@ -159,6 +317,162 @@ def process_netlist():
             'message': str(e)
         }), 500
 
+# threads that hand batch items to the solver, the solver itself runs in
+# subprocesses or the SolverPool so these only wait
+batch_executor = ThreadPoolExecutor(max_workers=processor.pool.size if processor.pool else (os.cpu_count() or 1))
+
+def _batch_items():
+    """Items of a batch request, from a JSON array, {'netlists': [...]} or NDJSON lines."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        body = request.get_data(as_text=True)
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        items = request.get_json()
+        if isinstance(items, dict):
+            items = items.get('netlists')
+    if not isinstance(items, list):
+        raise ValueError('Expected an array of netlists')
+    # a bare string is shorthand for {'netlist': string}
+    return [{'netlist': it} if isinstance(it, str) else it for it in items]
+
+def _batch_job(netlist_content, mode, diagram_format):
+    try:
+        return run_netlist(netlist_content, mode, diagram_format)
+    except PreflightError as e:
+        return {'status': 'error', 'message': str(e), 'diagnostics': e.diagnostics}
+    except Exception as e:
+        return {'status': 'error', 'message': str(e)}
+
+@app.route('/process-netlists', methods=['POST'])
+def process_netlists():
+    """Solve many netlists in one call, results stream back as NDJSON lines with their index.
+
+    Each item may set 'mode', 'diagramFormat' and 'diagram': false to skip the drawing.
+    Identical netlists are solved once, other items are solved on their own
+    (items with the same topology only share the cached diagram). Every line
+    carries the topology hash so clients can group the results. Results come
+    back as they finish unless ?ordered=1 is given.
+    """
+    try:
+        items = _batch_items()
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    ordered = request.args.get('ordered', '0') not in ('0', 'false', '')
+    errors = {}
+    jobs = {}       # (netlist, mode, diagram format) -> Future
+    job_of = []     # job key of each item, None for invalid items
+    for i, item in enumerate(items):
+        netlist_content = item.get('netlist') if isinstance(item, dict) else None
+        mode = item.get('mode', 'symbolic') if isinstance(item, dict) else None
+        diagram_format = item.get('diagramFormat', 'png') if isinstance(item, dict) else None
+        if isinstance(item, dict) and item.get('diagram', True) is False:
+            diagram_format = None
+        if not isinstance(netlist_content, str):
+            errors[i] = 'No netlist content provided'
+        elif mode not in ANALYSIS_MODES:
+            errors[i] = f'Unknown analysis mode: {mode}'
+        elif diagram_format is not None and diagram_format not in FORMATS:
+            errors[i] = f'Unknown diagram format: {diagram_format}'
+        if i in errors:
+            job_of.append(None)
+            continue
+        key = (netlist_content, mode, diagram_format)
+        job_of.append(key)
+
+    # in input order, so ordered responses can start streaming early
+    topo = {key: topology_key(netlist_edges(key[0]), '') for key in job_of if key is not None}
+    for key in topo:
+        jobs[key] = batch_executor.submit(_batch_job, *key)
+
+    def line(i, result):
+        key = job_of[i]
+        return json.dumps({'index': i, 'topology': topo[key] if key else None, **result}) + '\n'
+
+    def generate():
+        if ordered:
+            for i, key in enumerate(job_of):
+                if key is None:
+                    yield line(i, {'status': 'error', 'message': errors[i]})
+                else:
+                    yield line(i, jobs[key].result())
+        else:
+            for i, msg in errors.items():
+                yield line(i, {'status': 'error', 'message': msg})
+            waiting = defaultdict(list)
+            for i, key in enumerate(job_of):
+                if key is not None:
+                    waiting[key].append(i)
+            future_key = {f: key for key, f in jobs.items()}
+            for f in as_completed(future_key):
+                for i in waiting[future_key[f]]:
+                    yield line(i, f.result())
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/diagrams/<name>')
+def serve_diagram(name):
+    """Serve a rendered diagram, 202 while it is still being drawn."""
+    status = diagrams.status(name)
+    if status == 'ready':
+        return send_from_directory(diagrams.output_dir, name)
+    if status == 'pending':
+        return jsonify({'status': 'pending'}), 202
+    if status == 'failed':
+        return jsonify({'status': 'error', 'message': diagrams.failed.get(name, '')}), 500
+    return jsonify({'status': 'error', 'message': 'Unknown diagram'}), 404
+
+def _result_set(run_id):
+    from resultstore import ResultStore
+    return ResultStore(os.environ['RESULTS_DIR']).open(run_id)
+
+@app.route('/results/<run_id>')
+def result_info(run_id):
+    """Columns, row count and index column of a stored run."""
+    try:
+        rs = _result_set(run_id)
+    except KeyError:
+        return jsonify({'status': 'error', 'message': 'Unknown run'}), 404
+    meta = rs.meta
+    return jsonify({'runId': run_id, 'analysis': meta['analysis'], 'index': rs.index,
+                    'rows': rs.rows, 'complete': meta['complete'],
+                    'columns': [{'name': c['name'], 'dtype': c['dtype']} for c in meta['columns']]})
+
+@app.route('/results/<run_id>/data')
+def result_data(run_id):
+    """Signals of a run over an index window.
+
+    ?signals=v1,v3 picks columns (all by default), ?start= and ?stop= bound
+    the index column (sweep value, frequency or time), ?format=npz downloads
+    the selection as a numpy .npz file instead of JSON.
+    """
+    import numpy as np
+    try:
+        rs = _result_set(run_id)
+    except KeyError:
+        return jsonify({'status': 'error', 'message': 'Unknown run'}), 404
+    signals = request.args.get('signals')
+    signals = signals.split(',') if signals else None
+    try:
+        start = request.args.get('start', type=float)
+        stop = request.args.get('stop', type=float)
+        data = rs.read(signals, start, stop)
+    except KeyError as e:
+        return jsonify({'status': 'error', 'message': str(e.args[0])}), 400
+    fmt = request.args.get('format', 'json')
+    if fmt == 'npz':
+        buf = io.BytesIO()
+        np.savez(buf, **data)
+        return Response(buf.getvalue(), mimetype='application/octet-stream',
+                        headers={'Content-Disposition': f'attachment; filename={run_id}.npz'})
+    if fmt != 'json':
+        return jsonify({'status': 'error', 'message': f'Unknown format: {fmt}'}), 400
+    # complex columns (ac results) are sent as [re, im] pairs
+    cols = {k: np.column_stack([v.real, v.imag]).tolist() if np.iscomplexobj(v) else v.tolist()
+            for k, v in data.items()}
+    return jsonify({'runId': run_id, 'index': rs.index, 'rows': len(next(iter(cols.values()), [])),
+                    'columns': cols})
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'})
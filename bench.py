@@ -0,0 +1,201 @@
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from circuit import Circuit
+from dcsweep import dc_sweep
+from mna import Factorization
+from partition import partitioned_solve
+
+# Benchmarks for the circuit model and process start up
+# run with: python bench.py [circuit [number of ladder sections] | dc [number of points] |
+#                           partition [mesh side] | startup]
+
+# cold start budgets in seconds, each one is a fresh interpreter
+STARTUP_BUDGET = {
+    'import app': 1.0,
+    'server2.py numeric': 1.5,
+}
+
+
+def ladder_netlist(sections):
+    """RC ladder driven by a voltage source, 2 elements per section."""
+    lines = ['V1 1 0 1']
+    for k in range(1, sections + 1):
+        lines.append('R{:d} {:d} {:d} 1.0'.format(k, k, k + 1))
+        lines.append('C{:d} {:d} 0 1e-6'.format(k, k + 1))
+    return lines
+
+
+def mesh_netlist(side):
+    """Square resistor mesh with a capacitor to ground at every node, driven at a corner."""
+    lines = ['V1 1 0 1']
+    k = 0
+    for i in range(side):
+        for j in range(side):
+            nd = i * side + j + 1
+            if j + 1 < side:
+                k += 1
+                lines.append('R{:d} {:d} {:d} 1.0'.format(k, nd, nd + 1))
+            if i + 1 < side:
+                k += 1
+                lines.append('R{:d} {:d} {:d} 1.0'.format(k, nd, nd + side))
+            lines.append('C{:d} {:d} 0 1e-9'.format(nd, nd))
+    lines.append('R{:d} {:d} 0 1.0'.format(k + 1, side * side))
+    return lines
+
+
+def build_dataframe(content):
+    # same layout and per row .loc writes as the original server2.py
+    df = pd.DataFrame(columns=['element', 'p node', 'n node', 'cp node', 'cn node',
+                               'Vout', 'value', 'Vname', 'Lname1', 'Lname2'])
+    for i, line in enumerate(content):
+        tk = line.split()
+        df.loc[i, 'element'] = tk[0]
+        df.loc[i, 'p node'] = int(tk[1])
+        df.loc[i, 'n node'] = int(tk[2])
+        df.loc[i, 'value'] = float(tk[3])
+    return df
+
+
+def stamp_dataframe(df, num_nodes):
+    # numeric version of the server2.py G matrix loop
+    G = np.zeros((num_nodes, num_nodes))
+    for i in range(len(df)):
+        n1 = df.loc[i, 'p node']
+        n2 = df.loc[i, 'n node']
+        if df.loc[i, 'element'][0] == 'R':
+            g = 1 / df.loc[i, 'value']
+            if (n1 != 0) and (n2 != 0):
+                G[n1-1, n2-1] += -g
+                G[n2-1, n1-1] += -g
+            if n1 != 0:
+                G[n1-1, n1-1] += g
+            if n2 != 0:
+                G[n2-1, n2-1] += g
+    return G
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_circuit_model(sections=2000):
+    content = ladder_netlist(sections)
+    n = len(content)
+
+    # the retained size is measured separately from the peak during construction
+    tracemalloc.start()
+    df = build_dataframe(content)
+    df_mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    ckt = Circuit.from_lines(content)
+    ckt_mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    _, df_parse, _ = measure(build_dataframe, content)
+    _, ckt_parse, _ = measure(Circuit.from_lines, content)
+    _, df_stamp, _ = measure(stamp_dataframe, df, sections + 1)
+    _, ckt_stamp, _ = measure(ckt.stamp)
+
+    print('circuit model, {:d} elements'.format(n))
+    print('{:>22s} {:>12s} {:>12s}'.format('', 'DataFrame', 'Circuit'))
+    print('{:>22s} {:12.1f} {:12.1f}'.format('bytes per element', df_mem / n, ckt_mem / n))
+    print('{:>22s} {:12.4f} {:12.4f}'.format('parse time (s)', df_parse, ckt_parse))
+    print('{:>22s} {:12.4f} {:12.4f}'.format('stamp time (s)', df_stamp, ckt_stamp))
+
+
+def bench_dc_sweep(points=10000, sections=200):
+    """.dc sweep against solving every point from scratch (estimated from 50 points)."""
+    ckt = Circuit.from_lines(ladder_netlist(sections))
+    system = ckt.stamp()
+    print('dc sweep, {:d} points, {:d} unknowns'.format(points, system.size))
+    _, one, _ = measure(lambda: Factorization(system.G).solve(system.Z()))
+    print('{:>22s} {:12.4f}'.format('one solve (s)', one))
+    for name in ('V1', 'R{:d}'.format(sections)):
+        vals = np.linspace(0.5, 5, points)
+        _, sweep, _ = measure(dc_sweep, ckt, [(name, vals)], system)
+        t0 = time.perf_counter()
+        for v in vals[:50]:
+            ckt.groups[name[0]].value[0 if name == 'V1' else sections - 1] = v
+            s = ckt.stamp()
+            Factorization(s.G).solve(s.Z())
+        naive = (time.perf_counter() - t0) * points / 50
+        print('{:>22s} {:12.4f} {:>12s} {:8.2f}'.format('sweep ' + name + ' (s)', sweep, 'pointwise', naive))
+
+
+def bench_partition(side=300):
+    """Direct sparse solve against the partitioned solve, one worker per subdomain."""
+    ckt = Circuit.from_lines(mesh_netlist(side))
+    system = ckt.stamp()
+    x, direct, _ = measure(lambda: Factorization(system.A()).solve(system.Z()))
+    cores = os.cpu_count() or 1
+    print('partitioned solve, {:d} unknowns, {:d} cores'.format(system.size, cores))
+    print('{:>22s} {:8.4f}'.format('direct (s)', direct))
+    for parts in sorted({2, 4, 8, cores}):
+        (xp, stats), elapsed, _ = measure(partitioned_solve, ckt, system, parts, min(parts, cores))
+        print('{:>22s} {:8.4f}  interface {:d}, imbalance {:.2f}, error {:.1e}'.format(
+            '{:d} parts (s)'.format(parts), elapsed, stats['interface'], stats['imbalance'],
+            np.abs(xp - x).max()))
+
+
+def time_process(args, env=None, repeat=3):
+    """Best wall clock time of a fresh python process."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=here, env={**os.environ, **(env or {})},
+                       stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_startup():
+    """Cold start times checked against STARTUP_BUDGET, returns False if any is over."""
+    runs = {
+        'import app': (['-c', 'import app'], {'SOLVER_WORKERS': '0'}),
+        'server2.py numeric': (['server2.py'], {'NETLIST_PATH': 'test_1.net', 'ANALYSIS_MODE': 'numeric'}),
+        'server2.py symbolic': (['server2.py'], {'NETLIST_PATH': 'test_1.net', 'ANALYSIS_MODE': 'symbolic'}),
+    }
+    ok = True
+    print('start up time')
+    for name, (args, env) in runs.items():
+        elapsed = time_process(args, env)
+        budget = STARTUP_BUDGET.get(name)
+        if budget is None:
+            status = ''
+        elif elapsed <= budget:
+            status = 'ok (budget {:.2f})'.format(budget)
+        else:
+            status = 'OVER BUDGET ({:.2f})'.format(budget)
+            ok = False
+        print('{:>22s} {:8.3f} s  {}'.format(name, elapsed, status))
+    return ok
+
+
+if __name__ == '__main__':
+    which = sys.argv[1] if len(sys.argv) > 1 else 'all'
+    ok = True
+    if which in ('all', 'circuit'):
+        bench_circuit_model(int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
+    if which in ('all', 'dc'):
+        bench_dc_sweep(int(sys.argv[2]) if len(sys.argv) > 2 and which == 'dc' else 10000)
+    if which in ('all', 'partition'):
+        bench_partition(int(sys.argv[2]) if len(sys.argv) > 2 and which == 'partition' else 300)
+    if which in ('all', 'startup'):
+        ok = bench_startup()
+    sys.exit(0 if ok else 1)
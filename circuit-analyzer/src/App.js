@@ -192,6 +192,23 @@ const ResultsDisplay = ({ output, circuitDiagramUrl }) => {
 //   );
 // };
 
+const DIAGRAM_POLL_MS = 500;
+const DIAGRAM_POLL_TRIES = 60;
+
+// Poll a diagram URL until it is rendered (200), false if it failed or never finished
+const waitForDiagram = async (url) => {
+  for (let i = 0; i < DIAGRAM_POLL_TRIES; i++) {
+    const response = await fetch(url, { method: 'GET', cache: 'no-store' });
+    if (response.status === 200) return true;
+    if (response.status !== 202) {
+      console.error('Circuit diagram failed:', response.status);
+      return false;
+    }
+    await new Promise((resolve) => setTimeout(resolve, DIAGRAM_POLL_MS));
+  }
+  return false;
+};
+
 export default function CircuitAnalyzer() {
   const [elements, setElements] = useState([]);
   const [equations, setEquations] = useState([]);
@@ -281,8 +298,14 @@ export default function CircuitAnalyzer() {
       if (data.status === 'success') {
         setEquations([data.results.output]);
         setActiveTab('results');
-          // Save the circuit diagram URL for display
-      setCircuitDiagramUrl(`http://localhost:5001${data.circuitDiagram}`);
+        setCircuitDiagramUrl('');
+        if (data.circuitDiagram) {
+          const url = `http://localhost:5001${data.circuitDiagram}`;
+          // Show the diagram once it is rendered, the server answers 202 until then
+          if (data.diagramStatus === 'ready' || await waitForDiagram(url)) {
+            setCircuitDiagramUrl(url);
+          }
+        }
       } else {
         setEquations([`Error: ${data.message}`]);
       }
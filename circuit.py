@@ -0,0 +1,380 @@
+import numpy as np
+from scipy import sparse
+
+# Compact circuit model used in place of the pandas data frame
+# Elements are stored per type as a structure of arrays (int32 nodes, float64 values)
+# Element records with __slots__ are built on demand for code that walks the netlist
+
+# number of tokens expected on a netlist line for each element type
+TOKEN_COUNT = {'R': 4, 'L': 4, 'C': 4, 'V': 4, 'I': 4, 'O': 4,
+               'E': 6, 'G': 6, 'F': 5, 'H': 5, 'K': 4}
+
+# element types with an unknown current, these make up the B, C, D and J arrays
+BRANCH_TYPES = ('L', 'V', 'O', 'E', 'H', 'F')
+
+
+def clean_netlist(lines):
+    """Strip comments, directives and blank lines, capitalize element names."""
+    content = [x.strip() for x in lines]
+    content = [x for x in content if x and x[0] not in '*;.']
+    content = [x.capitalize() for x in content]
+    return [' '.join(x.split()) for x in content]
+
+
+def netlist_directives(lines):
+    """Spice directives as lower case token lists, e.g. ['.sens', 'v(3)']."""
+    return [x.strip().lower().split() for x in lines
+            if x.strip().startswith('.') and x.strip().lower() != '.end']
+
+
+def read_netlist(path):
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    return Circuit.from_lines(clean_netlist(lines), netlist_directives(lines))
+
+
+class Element:
+    """One netlist line, node numbers are ints with 0 as ground."""
+    __slots__ = ('name', 'kind', 'p', 'n', 'cp', 'cn', 'vout', 'value',
+                 'vname', 'lname1', 'lname2')
+
+    def __init__(self, name, p=None, n=None, cp=None, cn=None, vout=None,
+                 value=None, vname=None, lname1=None, lname2=None):
+        self.name = name
+        self.kind = name[0]
+        self.p = p
+        self.n = n
+        self.cp = cp
+        self.cn = cn
+        self.vout = vout
+        self.value = value
+        self.vname = vname
+        self.lname1 = lname1
+        self.lname2 = lname2
+
+    def __repr__(self):
+        return 'Element({})'.format(self.name)
+
+
+class ElementGroup:
+    """All elements of one type as parallel arrays."""
+    __slots__ = ('kind', 'names', 'p', 'n', 'cp', 'cn', 'vout', 'value',
+                 'ctrl', 'ctrl2', 'branch')
+
+    def __init__(self, kind, rows):
+        self.kind = kind
+        self.names = [r.name for r in rows]
+        self.value = np.array([r.value if r.value is not None else np.nan for r in rows], dtype=np.float64)
+        if kind == 'K':
+            self.p = self.n = None
+        else:
+            self.p = np.array([r.p for r in rows], dtype=np.int32)
+            self.n = np.array([r.n for r in rows], dtype=np.int32)
+        if kind in ('E', 'G'):
+            self.cp = np.array([r.cp for r in rows], dtype=np.int32)
+            self.cn = np.array([r.cn for r in rows], dtype=np.int32)
+        else:
+            self.cp = self.cn = None
+        self.vout = np.array([r.vout for r in rows], dtype=np.int32) if kind == 'O' else None
+        # names of the controlling branches, F/H use ctrl, K uses ctrl and ctrl2
+        if kind in ('F', 'H'):
+            self.ctrl, self.ctrl2 = [r.vname for r in rows], None
+        elif kind == 'K':
+            self.ctrl, self.ctrl2 = [r.lname1 for r in rows], [r.lname2 for r in rows]
+        else:
+            self.ctrl = self.ctrl2 = None
+        # position of the element's current in the unknown vector, filled in by Circuit
+        self.branch = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def record(self, j):
+        if self.kind == 'K':
+            return Element(self.names[j], value=float(self.value[j]),
+                           lname1=self.ctrl[j], lname2=self.ctrl2[j])
+        el = Element(self.names[j], p=int(self.p[j]), n=int(self.n[j]))
+        if self.kind != 'O':
+            el.value = float(self.value[j])
+        if self.cp is not None:
+            el.cp, el.cn = int(self.cp[j]), int(self.cn[j])
+        if self.vout is not None:
+            el.vout = int(self.vout[j])
+        if self.ctrl is not None:
+            el.vname = self.ctrl[j]
+        return el
+
+
+def _parse_line(line):
+    tk = line.split()
+    x = tk[0][0]
+    if x in ('R', 'L', 'C', 'V', 'I'):
+        return Element(tk[0], p=int(tk[1]), n=int(tk[2]), value=float(tk[3]))
+    if x == 'O':
+        return Element(tk[0], p=int(tk[1]), n=int(tk[2]), vout=int(tk[3]))
+    if x in ('E', 'G'):
+        return Element(tk[0], p=int(tk[1]), n=int(tk[2]), cp=int(tk[3]),
+                       cn=int(tk[4]), value=float(tk[5]))
+    if x in ('F', 'H'):
+        return Element(tk[0], p=int(tk[1]), n=int(tk[2]),
+                       vname=tk[3].capitalize(), value=float(tk[4]))
+    if x == 'K':
+        return Element(tk[0], lname1=tk[1].capitalize(), lname2=tk[2].capitalize(),
+                       value=float(tk[3]))
+    return None
+
+
+class Circuit:
+    """Parsed netlist, one ElementGroup per element type."""
+
+    def __init__(self, groups, order, directives=None):
+        self.groups = groups   # element letter -> ElementGroup
+        self.order = order     # (letter, row in group) for each element in netlist order
+        self.directives = directives or []
+        self.num_nodes = self._count_nodes()
+
+        # unknown currents are numbered in netlist order, like df2 in server2.py
+        self.branch_names = []
+        self.branch_nodes = []
+        for x, j in order:
+            if x in BRANCH_TYPES:
+                g = groups[x]
+                if g.branch is None:
+                    g.branch = np.zeros(len(g), dtype=np.int32)
+                g.branch[j] = len(self.branch_names)
+                self.branch_names.append(g.names[j])
+                self.branch_nodes.append((int(g.p[j]), int(g.n[j])))
+        self._branch_index = {name: k for k, name in enumerate(self.branch_names)}
+
+    @classmethod
+    def from_lines(cls, content, directives=None):
+        rows = {}
+        order = []
+        for i, line in enumerate(content):
+            el = _parse_line(line)
+            if el is None:
+                print("unknown element type in branch {:d}, {:s}".format(i, line))
+                continue
+            rows.setdefault(el.kind, []).append(el)
+            order.append((el.kind, len(rows[el.kind]) - 1))
+        groups = {x: ElementGroup(x, r) for x, r in rows.items()}
+        return cls(groups, order, directives)
+
+    def __len__(self):
+        return len(self.order)
+
+    @property
+    def elements(self):
+        """Element records in netlist order."""
+        return [self.groups[x].record(j) for x, j in self.order]
+
+    @property
+    def unknown_names(self):
+        """Names of the MNA unknowns, v1 .. vn and then I_<element> per branch current."""
+        return ['v{:d}'.format(i + 1) for i in range(self.num_nodes)] + ['I_' + b for b in self.branch_names]
+
+    @property
+    def num_branches(self):
+        return len(self.branch_names)
+
+    def count(self, kind):
+        return len(self.groups[kind]) if kind in self.groups else 0
+
+    def branch_index(self, name):
+        """Column of the unknown current of a named branch (replaces find_vname)."""
+        try:
+            return self._branch_index[name]
+        except KeyError:
+            raise KeyError('no branch with an unknown current named {}'.format(name))
+
+    def _node_arrays(self):
+        for g in self.groups.values():
+            for a in (g.p, g.n, g.cp, g.cn, g.vout):
+                if a is not None and len(a):
+                    yield a
+
+    def _count_nodes(self):
+        arrays = list(self._node_arrays())
+        return int(max(a.max() for a in arrays)) if arrays else 0
+
+    def missing_nodes(self):
+        """Node numbers between 1 and num_nodes that no element connects to."""
+        used = np.zeros(self.num_nodes + 1, dtype=bool)
+        for a in self._node_arrays():
+            used[a] = True
+        return [int(k) for k in np.flatnonzero(~used[1:]) + 1]
+
+    def to_dataframe(self):
+        """Build the df and df2 data frames of server2.py, for report output."""
+        import pandas as pd
+        cols = {'element': 'name', 'p node': 'p', 'n node': 'n', 'cp node': 'cp',
+                'cn node': 'cn', 'Vout': 'vout', 'value': 'value', 'Vname': 'vname',
+                'Lname1': 'lname1', 'Lname2': 'lname2'}
+        els = self.elements
+        df = pd.DataFrame({c: [getattr(el, a) for el in els] for c, a in cols.items()},
+                          dtype=object)
+        df = df.where(df.notna(), np.nan)
+        df2 = pd.DataFrame({'element': self.branch_names,
+                            'p node': [p for p, n in self.branch_nodes],
+                            'n node': [n for p, n in self.branch_nodes]}, dtype=object)
+        return df, df2
+
+    def stamp(self):
+        """Stamp the numeric MNA system, see MNASystem."""
+        n = self.num_nodes
+        size = n + self.num_branches
+        Gt = _Triplets()   # entries independent of s
+        Ct = _Triplets()   # entries multiplied by s
+        src_names = []
+        St = _Triplets()
+
+        def two_terminal(t, p, q, val):
+            # conductance style stamp between nodes p and q
+            t.add(p - 1, p - 1, val, p, p)
+            t.add(q - 1, q - 1, val, q, q)
+            t.add(p - 1, q - 1, -val, p, q)
+            t.add(q - 1, p - 1, -val, q, p)
+
+        if 'R' in self.groups:
+            g = self.groups['R']
+            two_terminal(Gt, g.p, g.n, 1 / g.value)
+        if 'C' in self.groups:
+            g = self.groups['C']
+            two_terminal(Ct, g.p, g.n, g.value)
+        if 'G' in self.groups:
+            g = self.groups['G']
+            Gt.add(g.p - 1, g.cp - 1, g.value, g.p, g.cp)
+            Gt.add(g.n - 1, g.cn - 1, g.value, g.n, g.cn)
+            Gt.add(g.p - 1, g.cn - 1, -g.value, g.p, g.cn)
+            Gt.add(g.n - 1, g.cp - 1, -g.value, g.n, g.cp)
+
+        one = None
+        for x in BRANCH_TYPES:
+            if x not in self.groups:
+                continue
+            g = self.groups[x]
+            k = n + g.branch
+            one = np.ones(len(g))
+            # B matrix, current of the branch leaves p and enters n
+            if x == 'O':
+                Gt.add(g.vout - 1, k, one, g.vout)
+            else:
+                Gt.add(g.p - 1, k, one, g.p)
+                Gt.add(g.n - 1, k, -one, g.n)
+            # C matrix, branch voltage equation
+            if x != 'F':
+                Gt.add(k, g.p - 1, one, g.p)
+                Gt.add(k, g.n - 1, -one, g.n)
+            if x == 'E':
+                Gt.add(k, g.cp - 1, -g.value, g.cp)
+                Gt.add(k, g.cn - 1, g.value, g.cn)
+            # D matrix
+            if x == 'L':
+                Ct.add(k, k, -g.value)
+            if x in ('H', 'F'):
+                ctrl = n + np.array([self.branch_index(name) for name in g.ctrl], dtype=np.int32)
+                Gt.add(k, ctrl, -g.value)
+            if x == 'F':
+                Gt.add(k, k, one)
+            if x == 'V':
+                St.add(k, len(src_names) + np.arange(len(g)), one)
+                src_names += g.names
+        if 'K' in self.groups:
+            g = self.groups['K']
+            L = self.groups['L']
+            lval = dict(zip(L.names, L.value))
+            k1 = n + np.array([self.branch_index(name) for name in g.ctrl], dtype=np.int32)
+            k2 = n + np.array([self.branch_index(name) for name in g.ctrl2], dtype=np.int32)
+            # mutual inductance M = k*sqrt(L1*L2)
+            M = g.value * np.sqrt([lval[a] * lval[b] for a, b in zip(g.ctrl, g.ctrl2)])
+            Ct.add(k1, k2, -M)
+            Ct.add(k2, k1, -M)
+        if 'I' in self.groups:
+            g = self.groups['I']
+            cols = len(src_names) + np.arange(len(g))
+            one = np.ones(len(g))
+            # current sources have n2 = arrow end of the element
+            St.add(g.p - 1, cols, -one, g.p)
+            St.add(g.n - 1, cols, one, g.n)
+            src_names += g.names
+        src_values = np.concatenate([self.groups[x].value for x in ('V', 'I') if x in self.groups]) \
+            if src_names else np.zeros(0)
+
+        names = self.unknown_names
+        return MNASystem(Gt.tocsr(size, size), Ct.tocsr(size, size),
+                         St.tocsr(size, len(src_names)), src_values, names, src_names)
+
+
+class _Triplets:
+    """Accumulates COO entries, rows/cols at ground (node 0 -> index -1) are dropped."""
+
+    def __init__(self):
+        self.rows, self.cols, self.vals = [], [], []
+
+    def add(self, r, c, v, *nodes):
+        r, c, v = np.broadcast_arrays(r, c, v)
+        keep = np.ones(r.shape, dtype=bool)
+        for nd in nodes:
+            keep &= np.asarray(nd) != 0
+        self.rows.append(r[keep])
+        self.cols.append(c[keep])
+        self.vals.append(v[keep])
+
+    def tocsr(self, nr, nc):
+        if not self.rows:
+            return sparse.csr_matrix((nr, nc))
+        # duplicate entries are summed, like += in the symbolic stamps
+        return sparse.coo_matrix((np.concatenate(self.vals),
+                                  (np.concatenate(self.rows), np.concatenate(self.cols))),
+                                 shape=(nr, nc)).tocsr()
+
+
+class MNASystem:
+    """Numeric MNA matrices, A(s) = G + s*C and Z = S*u.
+
+    G and C are scipy sparse matrices over the unknowns [V, J], S maps the
+    independent source values u (V sources first, then I sources) onto Z.
+    """
+
+    def __init__(self, G, C, S, u, names, sources):
+        self.G = G
+        self.C = C
+        self.S = S
+        self.u = u
+        self.names = names
+        self.sources = sources
+
+    @property
+    def size(self):
+        return self.G.shape[0]
+
+    @property
+    def num_nodes(self):
+        return sum(1 for x in self.names if x.startswith('v'))
+
+    def A(self, s=0):
+        return self.G + s * self.C if s != 0 else self.G.copy()
+
+    def Z(self, u=None):
+        return self.S @ (self.u if u is None else u)
+
+    def output_vector(self, spec):
+        """Selector e with y = e.T*X for an output like V(3), V(3,5) or I(V1)."""
+        spec = spec.strip()
+        kind, args = spec[0].upper(), spec[2:-1] if spec[1:2] == '(' and spec.endswith(')') else None
+        e = np.zeros(self.size)
+        if kind == 'V' and args is not None:
+            nodes = [int(a) for a in args.split(',')]
+            for nd, sign in zip(nodes, (1, -1)):
+                if not 0 <= nd <= self.num_nodes:
+                    raise ValueError('output {} refers to unknown node {:d}'.format(spec, nd))
+                if nd != 0:
+                    e[nd - 1] += sign
+            return e
+        if kind == 'I' and args is not None:
+            name = 'I_' + args.strip().capitalize()
+            if name in self.names:
+                e[self.names.index(name)] = 1
+                return e
+            raise ValueError('output {} needs an element with an unknown current'.format(spec))
+        raise ValueError('cannot parse output {}'.format(spec))
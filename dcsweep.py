@@ -0,0 +1,213 @@
+import numpy as np
+from scipy import sparse
+
+from mna import Factorization
+
+# DC sweeps of source and element values
+# The circuit is linear, so every sweep point is solved exactly from the one
+# factorization of the nominal A0 = G:
+#  - a source value only moves the right hand side, x = x0 + dp*A0^-1*S_j,
+#    so any number of source points is one blocked solve
+#  - an element value changes A0 by a rank-1 term, A(p) = A0 + df*u*w.T
+#    (df = 1/p - 1/p0 for resistors, p - p0 for controlled source gains),
+#    which is solved with the Sherman-Morrison-Woodbury formula
+# Each point is checked by its residual and refactored on its own only if the
+# update lost accuracy (or the point is singular)
+
+# element types whose value changes the DC matrix, and how the stamp depends on it
+MATRIX_TYPES = ('R', 'G', 'E', 'F', 'H')
+SOURCE_TYPES = ('V', 'I')
+
+# points with a larger relative residual are solved again with their own LU
+RESIDUAL_TOL = 1e-9
+# sweep points solved together, bounds the memory of long sweeps on large circuits
+CHUNK_POINTS = 4096
+
+
+class DCSweepResult:
+    """Solutions of a .dc sweep as columns, one entry per sweep point.
+
+    params are the swept element names, inner (fastest varying) first, and
+    shape is the grid shape (outer points, inner points). columns() maps each
+    param and each unknown (v1, ..., I_V1, ...) to an array over the points.
+    Chunks from iter_dc_sweep have shape None.
+    """
+
+    def __init__(self, params, values, names, X, shape=None, refactored=0):
+        self.params = params
+        self.values = values   # (params, points)
+        self.names = names
+        self.X = X             # (unknowns, points)
+        self.shape = shape
+        self.refactored = refactored
+
+    def __len__(self):
+        return self.X.shape[1]
+
+    def column(self, name):
+        if name in self.params:
+            return self.values[self.params.index(name)]
+        return self.X[self.names.index(name)]
+
+    def columns(self):
+        cols = {p: self.values[i] for i, p in enumerate(self.params)}
+        cols.update(zip(self.names, self.X))
+        return cols
+
+
+def sweep_values(start, stop, step):
+    """Points of a spice style linear sweep, stop is included."""
+    start, stop, step = float(start), float(stop), float(step)
+    if step == 0 or (stop - start) * step < 0:
+        raise ValueError('.dc step {:g} does not go from {:g} to {:g}'.format(step, start, stop))
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return start + step * np.arange(count)
+
+
+def _find(ckt, name):
+    # element names are matched without case, directive tokens are lower case
+    for x, g in ckt.groups.items():
+        for j, el in enumerate(g.names):
+            if el.lower() == name.lower():
+                return x, j
+    raise ValueError('.dc sweeps unknown element {}'.format(name))
+
+
+def _unit(size, row, sign=1.0):
+    # +-1 at an MNA row, rows of ground (-1) are dropped
+    v = np.zeros(size)
+    if row >= 0:
+        v[row] += sign
+    return v
+
+
+def update_vectors(ckt, x, j, size):
+    """u, w and f with A(p) = A0 + (f(p) - f(p0))*u*w.T for element j of type x."""
+    g = ckt.groups[x]
+    n = ckt.num_nodes
+    if x == 'R':
+        a = _unit(size, g.p[j] - 1) - _unit(size, g.n[j] - 1)
+        return a, a, lambda p: 1 / p
+    if x == 'G':
+        u = _unit(size, g.p[j] - 1) - _unit(size, g.n[j] - 1)
+        w = _unit(size, g.cp[j] - 1) - _unit(size, g.cn[j] - 1)
+        return u, w, lambda p: p
+    k = n + g.branch[j]
+    if x == 'E':
+        w = _unit(size, g.cn[j] - 1) - _unit(size, g.cp[j] - 1)
+        return _unit(size, k), w, lambda p: p
+    if x in ('F', 'H'):
+        return _unit(size, k), _unit(size, n + ckt.branch_index(g.ctrl[j]), -1), lambda p: p
+    raise ValueError('{} does not change the DC solution and cannot be swept'.format(g.names[j]))
+
+
+def iter_dc_sweep(ckt, sweeps, system=None, chunk=CHUNK_POINTS):
+    """Solve up to two nested sweeps, yields a DCSweepResult per chunk of points.
+
+    sweeps is a list of (element name, values), the first one varies fastest.
+    Independent sources and R, G, E, F, H values can be swept. All chunks
+    share the one factorization of the nominal matrix.
+    """
+    if system is None:
+        system = ckt.stamp()
+    if not 1 <= len(sweeps) <= 2:
+        raise ValueError('.dc takes one or two sweeps')
+    size = system.size
+    lu = Factorization(system.G)
+
+    params, grids, found = [], [], []
+    for name, vals in sweeps:
+        x, j = _find(ckt, name)
+        params.append(ckt.groups[x].names[j])
+        found.append((x, j))
+        grids.append(np.asarray(vals, dtype=float))
+    # every point of the grid, inner sweep fastest
+    mesh = np.meshgrid(*grids[::-1], indexing='ij')[::-1]
+    values = np.array([m.ravel() for m in mesh])
+
+    # b = b0 + sum of (p - p0)*S_j over the swept sources, and A0^-1 of each term
+    b0 = system.Z()
+    rhs, src = [b0], []
+    for k, (x, j) in enumerate(found):
+        if x in SOURCE_TYPES:
+            col = system.sources.index(ckt.groups[x].names[j])
+            rhs.append(system.S[:, col].toarray().ravel())
+            src.append((k, system.u[col]))
+    rhs = np.column_stack(rhs)
+    sol = lu.solve(rhs)
+
+    # low rank updates of the matrix for swept element values
+    U, W, upd = [], [], []
+    for k, (x, j) in enumerate(found):
+        if x in SOURCE_TYPES:
+            continue
+        if x not in MATRIX_TYPES:
+            raise ValueError('{} does not change the DC solution and cannot be swept'
+                             .format(ckt.groups[x].names[j]))
+        u, w, f = update_vectors(ckt, x, j, size)
+        U.append(u)
+        W.append(w)
+        upd.append((k, f, f(ckt.groups[x].value[j])))
+    if U:
+        U, W = np.column_stack(U), np.column_stack(W)
+        # Woodbury, x = z - Y*(I + D*W.T*Y)^-1*D*W.T*z with Y = A0^-1*U
+        Y = lu.solve(U)
+        M = W.T @ Y
+        rank = M.shape[0]
+
+    for first in range(0, values.shape[1], chunk):
+        vals = values[:, first:first + chunk]
+        points = vals.shape[1]
+        # every source point from the one blocked solve
+        Xb = np.repeat(sol[:, :1], points, axis=1)
+        B = np.repeat(b0[:, None], points, axis=1)
+        for i, (k, u0) in enumerate(src):
+            d = vals[k] - u0
+            Xb += sol[:, i + 1:i + 2] * d[None, :]
+            B += rhs[:, i + 1:i + 2] * d[None, :]
+
+        X = Xb
+        bad = np.zeros(points, dtype=bool)
+        if upd:
+            with np.errstate(divide='ignore'):
+                D = np.column_stack([f(vals[k]) - f0 for k, f, f0 in upd])   # (points, rank)
+            # a resistor swept through 0 gives D = inf, those points are caught below
+            with np.errstate(invalid='ignore', over='ignore'):
+                core = np.eye(rank)[None] + D[:, :, None] * M[None]
+                det = np.linalg.det(core)
+                ok = np.isfinite(det) & (np.abs(det) > 1e-12) & np.all(np.isfinite(D), axis=1)
+            WX = (D * (Xb.T @ W))[ok]
+            c = np.zeros((points, rank))
+            c[ok] = np.linalg.solve(core[ok], WX[:, :, None])[:, :, 0]
+            X = Xb - Y @ c.T
+            bad = ~ok
+            # residual of A(p)*x = b at every point, A(p)*x = A0*x + U*D*W.T*x
+            with np.errstate(invalid='ignore', over='ignore'):
+                GX = system.G @ X
+                R = GX + U @ (D * (X.T @ W)).T - B
+                scale = np.abs(B).max(axis=0) + np.abs(GX).max(axis=0)
+                bad |= ~(np.abs(R).max(axis=0) <= RESIDUAL_TOL * np.maximum(scale, 1e-300))
+
+        # points the update could not solve accurately get their own factorization
+        for i in np.flatnonzero(bad):
+            if not np.all(np.isfinite(D[i])):
+                # e.g. a resistor swept through zero
+                X[:, i] = np.nan
+                continue
+            A = system.G + sparse.csr_matrix(U * D[i][None, :]) @ sparse.csr_matrix(W.T)
+            try:
+                X[:, i] = Factorization(A).solve(B[:, i])
+            except np.linalg.LinAlgError:
+                X[:, i] = np.nan
+        yield DCSweepResult(params, vals, system.names, X, refactored=int(bad.sum()))
+
+
+def dc_sweep(ckt, sweeps, system=None):
+    """Solve every point of up to two nested sweeps, see iter_dc_sweep."""
+    chunks = list(iter_dc_sweep(ckt, sweeps, system))
+    shape = tuple(len(vals) for _, vals in sweeps[::-1])
+    if len(shape) == 1:
+        shape = (1,) + shape
+    first = chunks[0]
+    return DCSweepResult(first.params, np.hstack([c.values for c in chunks]), first.names,
+                         np.hstack([c.X for c in chunks]), shape, sum(c.refactored for c in chunks))
@@ -0,0 +1,280 @@
+import hashlib
+import html
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# circuits with at most this many edges are laid out in process for svg output
+SMALL_CIRCUIT = 40
+# above this many edges the diagram is summarized instead of drawing every element
+LARGE_CIRCUIT = 500
+# number of node clusters drawn for a summarized diagram
+MAX_CLUSTERS = 40
+
+FORMATS = ('png', 'svg')
+
+# cache retention, checked when a new diagram is queued (0 turns a limit off):
+# the KEEP_DIAGRAMS most recently used files are kept, none unused for
+# MAX_AGE seconds, and files younger than MIN_AGE stay for the clients polling them
+KEEP_DIAGRAMS = 1000
+MAX_AGE = 7 * 24 * 3600
+MIN_AGE = 600
+# render errors remembered for status(), the oldest are forgotten first
+MAX_FAILED = 256
+
+
+def netlist_edges(netlist_content):
+    """(element, p node, n node) for every two terminal branch of the netlist."""
+    # circuit pulls in numpy and scipy, keep it off the app's import path
+    from circuit import clean_netlist
+    edges = []
+    for line in clean_netlist(netlist_content.split('\n')):
+        tk = line.split()
+        # K lines name inductors, not nodes
+        if len(tk) < 3 or tk[0][0] == 'K':
+            continue
+        edges.append((tk[0], tk[1], tk[2]))
+    return edges
+
+
+def topology_key(edges, fmt):
+    """Cache key of a drawing, element values do not change the picture."""
+    h = hashlib.sha1(fmt.encode())
+    for e in edges:
+        h.update(' '.join(e).encode() + b'\n')
+    return h.hexdigest()[:20]
+
+
+def summarize(edges, max_clusters=MAX_CLUSTERS):
+    """Collapse a large netlist into clusters of neighbouring nodes.
+
+    Nodes are grouped in breadth first order so each cluster is a connected
+    patch of the circuit, ground is kept on its own. Returns the cluster
+    labels and (cluster a, cluster b, label) edges with element counts.
+    """
+    adj = defaultdict(set)
+    for _, p, n in edges:
+        adj[p].add(n)
+        adj[n].add(p)
+    nodes = [nd for nd in adj if nd != '0']
+    order, seen = [], {'0'}
+    for start in sorted(nodes, key=lambda x: (len(x), x)):
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = deque([start])
+        while queue:
+            nd = queue.popleft()
+            order.append(nd)
+            for nb in sorted(adj[nd]):
+                if nb not in seen:
+                    seen.add(nb)
+                    queue.append(nb)
+
+    per_cluster = max(1, math.ceil(len(order) / max_clusters))
+    cluster = {'0': 'gnd'}
+    labels = {'gnd': '0'}
+    for i, nd in enumerate(order):
+        c = 'c{:d}'.format(i // per_cluster)
+        cluster[nd] = c
+        labels.setdefault(c, [])
+        labels[c].append(nd)
+    labels = {c: v if c == 'gnd' else '{:d} nodes\n{}..{}'.format(len(v), v[0], v[-1])
+              for c, v in labels.items()}
+
+    counts = defaultdict(Counter)
+    for el, p, n in edges:
+        a, b = cluster[p], cluster[n]
+        if a == b:
+            continue
+        counts[tuple(sorted((a, b)))][el[0]] += 1
+    cedges = [(a, b, ' '.join('{}x{:d}'.format(k, v) for k, v in sorted(c.items())))
+              for (a, b), c in counts.items()]
+    return labels, cedges
+
+
+def render_svg(edges):
+    """Draw a small circuit without graphviz, nodes on a circle with ground at the bottom."""
+    nodes = []
+    for _, p, n in edges:
+        for nd in (p, n):
+            if nd not in nodes:
+                nodes.append(nd)
+    # ground first so it lands at the bottom of the circle
+    if '0' in nodes:
+        nodes.remove('0')
+        nodes.insert(0, '0')
+    size = max(240, 70 * len(nodes))
+    cx = cy = size / 2
+    r = size / 2 - 40
+    pos = {}
+    for i, nd in enumerate(nodes):
+        a = math.pi / 2 + 2 * math.pi * i / len(nodes)
+        pos[nd] = (cx + r * math.cos(a), cy + r * math.sin(a))
+
+    out = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0:.0f}" height="{0:.0f}" '
+           'font-family="sans-serif" font-size="12">'.format(size)]
+    # parallel elements between the same nodes are bent apart
+    seen = Counter()
+    for el, p, n in edges:
+        (x1, y1), (x2, y2) = pos[p], pos[n]
+        k = seen[frozenset((p, n))]
+        seen[frozenset((p, n))] += 1
+        bend = 0 if k == 0 else (30 * ((k + 1) // 2) * (1 if k % 2 else -1))
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy) or 1
+        mx = (x1 + x2) / 2 - bend * dy / length
+        my = (y1 + y2) / 2 + bend * dx / length
+        out.append('<path d="M{:.1f},{:.1f} Q{:.1f},{:.1f} {:.1f},{:.1f}" fill="none" stroke="black"/>'
+                   .format(x1, y1, 2 * mx - (x1 + x2) / 2, 2 * my - (y1 + y2) / 2, x2, y2))
+        out.append('<text x="{:.1f}" y="{:.1f}" text-anchor="middle" fill="#0056b3">{}</text>'
+                   .format(mx, my - 4, html.escape(el)))
+    for nd, (x, y) in pos.items():
+        out.append('<circle cx="{:.1f}" cy="{:.1f}" r="14" fill="white" stroke="black"/>'.format(x, y))
+        out.append('<text x="{:.1f}" y="{:.1f}" text-anchor="middle">{}</text>'
+                   .format(x, y + 4, html.escape(nd)))
+    out.append('</svg>')
+    return '\n'.join(out)
+
+
+def render_graphviz(edges, fmt, output_path):
+    """Draw with the graphviz dot program, large netlists are summarized first."""
+    from graphviz import Digraph
+    diagram = Digraph(format=fmt)
+    diagram.attr('node', shape='circle')
+    if len(edges) > LARGE_CIRCUIT:
+        labels, cedges = summarize(edges)
+        diagram.attr('node', shape='box')
+        diagram.attr(label='{:d} elements, summarized'.format(len(edges)))
+        for c, label in labels.items():
+            diagram.node(c, label)
+        for a, b, label in cedges:
+            diagram.edge(a, b, label=label, dir='none')
+    else:
+        for element, p_node, n_node in edges:
+            diagram.node(p_node)
+            diagram.node(n_node)
+            diagram.edge(p_node, n_node, label=element)
+    diagram.render(output_path, cleanup=True)
+
+
+class DiagramRenderer:
+    """Renders circuit diagrams in background threads, cached by topology.
+
+    The cache directory is pruned like a ResultStore: keep is the number of
+    files kept, least recently used first out, and max_age the seconds a
+    file may go unused. Files younger than min_age are never deleted.
+    """
+
+    def __init__(self, output_dir='static/diagrams', max_workers=2,
+                 keep=KEEP_DIAGRAMS, max_age=MAX_AGE, min_age=MIN_AGE):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.pending = {}   # file name -> Future
+        self.failed = OrderedDict()    # file name -> error message, oldest first
+        self.keep = keep
+        self.max_age = max_age
+        self.min_age = min_age
+
+    def filename(self, key, fmt):
+        return '{}.{}'.format(key, fmt)
+
+    def files(self):
+        """(modification time, file name) of every cached file, least recently used first."""
+        out = []
+        for name in os.listdir(self.output_dir):
+            try:
+                out.append((os.path.getmtime(os.path.join(self.output_dir, name)), name))
+            except OSError:
+                # deleted by another prune
+                continue
+        return sorted(out)
+
+    def prune(self, room=0):
+        """Delete files unused past max_age and the least recently used over keep - room."""
+        with self.lock:
+            # drawings in progress and their temp files (tmp-<name>, <name>.tmp)
+            busy = {nm.split('.')[0] for nm in self.pending}
+        busy |= {'tmp-' + key for key in busy}
+        files = [(mtime, nm) for mtime, nm in self.files() if nm.split('.')[0] not in busy]
+        now = time.time()
+        drop = set()
+        if self.max_age:
+            drop.update(nm for mtime, nm in files if mtime < now - self.max_age)
+        if self.keep:
+            over = files[:max(0, len(files) - self.keep + room)]
+            drop.update(nm for mtime, nm in over if mtime < now - self.min_age)
+        for nm in drop:
+            try:
+                os.remove(os.path.join(self.output_dir, nm))
+            except OSError:
+                pass
+        return sorted(drop)
+
+    def submit(self, netlist_content, fmt='png'):
+        """Queue a drawing of the netlist and return its file name right away."""
+        if fmt not in FORMATS:
+            raise ValueError('Unknown diagram format: {}'.format(fmt))
+        edges = netlist_edges(netlist_content)
+        name = self.filename(topology_key(edges, fmt), fmt)
+        path = os.path.join(self.output_dir, name)
+        with self.lock:
+            # unchanged topologies are never drawn twice
+            if name in self.pending:
+                return name
+            try:
+                # a cache hit counts as a use for pruning
+                os.utime(path)
+                return name
+            except OSError:
+                pass
+            self.failed.pop(name, None)
+            self.pending[name] = self.executor.submit(self._render, edges, fmt, name)
+        self.prune(room=1)
+        return name
+
+    def _render(self, edges, fmt, name):
+        path = os.path.join(self.output_dir, name)
+        try:
+            if fmt == 'svg' and len(edges) <= SMALL_CIRCUIT:
+                # small circuits skip forking dot, written to a temp name so readers never see half a file
+                with open(path + '.tmp', 'w') as f:
+                    f.write(render_svg(edges))
+                os.replace(path + '.tmp', path)
+            else:
+                base = os.path.join(self.output_dir, 'tmp-' + name)
+                render_graphviz(edges, fmt, base)
+                os.replace(base + '.' + fmt, path)
+        except Exception as e:
+            logger.error(f"Error rendering diagram {name}: {str(e)}")
+            with self.lock:
+                self.failed[name] = str(e)
+                while len(self.failed) > MAX_FAILED:
+                    self.failed.popitem(last=False)
+        finally:
+            with self.lock:
+                self.pending.pop(name, None)
+
+    def status(self, name):
+        """One of 'ready', 'pending', 'failed' or 'missing'."""
+        with self.lock:
+            if name in self.pending:
+                return 'pending'
+            if name in self.failed:
+                return 'failed'
+        return 'ready' if os.path.exists(os.path.join(self.output_dir, name)) else 'missing'
+
+    def wait(self, name, timeout=None):
+        with self.lock:
+            future = self.pending.get(name)
+        if future is not None:
+            future.result(timeout)
+        return self.status(name)
@@ -0,0 +1,119 @@
+import warnings
+
+import numpy as np
+from scipy import sparse
+from scipy.linalg import LinAlgWarning, lu_factor, lu_solve
+from scipy.sparse.linalg import splu
+
+# Numeric helpers for the MNA system A*X = Z built by server2.py
+# A is factored once and every right hand side is solved against the same LU,
+# so N excitations cost one factorization plus N triangular solves
+
+
+class Factorization:
+    """LU factorization of a square MNA matrix, reused for many right hand sides.
+
+    Dense arrays use LAPACK, scipy sparse matrices use a sparse LU (splu).
+    """
+
+    def __init__(self, A):
+        if A.ndim != 2 or A.shape[0] != A.shape[1]:
+            raise np.linalg.LinAlgError('MNA matrix must be square, got shape {}'.format(A.shape))
+        self.size = A.shape[0]
+        self.dtype = A.dtype
+        if sparse.issparse(A):
+            try:
+                self.splu = splu(sparse.csc_matrix(A))
+            except RuntimeError as e:
+                raise np.linalg.LinAlgError(str(e))
+            return
+        self.splu = None
+        # lu_factor only warns on an exactly singular matrix, treat it as an error
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', LinAlgWarning)
+            self.lu, self.piv = lu_factor(np.asarray(A), check_finite=True)
+        if np.any(np.diag(self.lu) == 0):
+            raise np.linalg.LinAlgError('Singular matrix')
+
+    def _sparse_solve(self, Z, trans):
+        # splu of a real matrix only takes real right hand sides
+        if np.iscomplexobj(Z) and self.splu.L.dtype.kind != 'c':
+            return self._sparse_solve(Z.real, trans) + 1j * self._sparse_solve(Z.imag, trans)
+        return self.splu.solve(np.ascontiguousarray(Z, dtype=self.splu.L.dtype), trans=trans)
+
+    def solve(self, Z):
+        """Solve A*X = Z, Z may be a vector or a matrix with one column per excitation."""
+        if self.splu is not None:
+            return self._sparse_solve(np.asarray(Z), 'N')
+        return lu_solve((self.lu, self.piv), np.asarray(Z), check_finite=False)
+
+    def solve_transposed(self, Z):
+        """Solve A.T*X = Z with the same factorization (adjoint system)."""
+        if self.splu is not None:
+            return self._sparse_solve(np.asarray(Z), 'T')
+        return lu_solve((self.lu, self.piv), np.asarray(Z), trans=1, check_finite=False)
+
+
+# Z = I + Ev is linear in the independent source values, so Z = S*u
+# S has one column per source and is found from the jacobian of Z
+def source_incidence(Z, sources):
+    from sympy import Matrix
+    S = Matrix(Z).jacobian(Matrix(sources))
+    return np.array(S.tolist(), dtype=float).reshape(len(Z), len(sources))
+
+
+def solve_excitations(A, S, U, lu=None):
+    """Solve the circuit for every column of U (source values, one row per source).
+
+    Returns X with one column per excitation. Pass an existing Factorization
+    as lu to skip factoring A again.
+    """
+    if lu is None:
+        lu = Factorization(A)
+    U = np.asarray(U)
+    # complex source values (phasors) keep their imaginary part
+    U = U.astype(np.result_type(U, lu.dtype), copy=False)
+    if U.ndim == 1:
+        U = U.reshape(-1, 1)
+    if U.shape[0] != S.shape[1]:
+        raise ValueError('excitation matrix has {:d} rows but circuit has {:d} sources'
+                         .format(U.shape[0], S.shape[1]))
+    return lu.solve(S @ U)
+
+
+def impedance_matrix(A, ports, lu=None):
+    """Extract the N x N impedance (Z-parameter) matrix between ports.
+
+    ports is a list of (p node, n node) pairs. A unit current is injected into
+    each port in turn, all N injections are solved in one blocked solve.
+    """
+    if lu is None:
+        lu = Factorization(A)
+    Inj = np.zeros((lu.size, len(ports)))
+    for k, (n1, n2) in enumerate(ports):
+        # current flows into n1 and out of n2, node 0 is ground
+        if n1 != 0:
+            Inj[n1-1, k] += 1
+        if n2 != 0:
+            Inj[n2-1, k] -= 1
+    X = lu.solve(Inj)
+    Zp = np.zeros((len(ports), len(ports)), dtype=X.dtype)
+    for j, (n1, n2) in enumerate(ports):
+        v1 = X[n1-1] if n1 != 0 else 0
+        v2 = X[n2-1] if n2 != 0 else 0
+        Zp[j] = v1 - v2
+    return Zp
+
+
+def sweep_frequencies(kind, points, fstart, fstop):
+    """Frequency points of a spice style ac sweep, kind is dec, oct or lin."""
+    points, fstart, fstop = int(points), float(fstart), float(fstop)
+    if fstart <= 0 and kind != 'lin':
+        raise ValueError('log frequency sweeps need fstart > 0')
+    if kind == 'lin':
+        return np.linspace(fstart, fstop, points)
+    if kind in ('dec', 'oct'):
+        base = 10.0 if kind == 'dec' else 2.0
+        count = int(np.floor(np.log(fstop / fstart) / np.log(base) * points + 1e-9)) + 1
+        return fstart * base ** (np.arange(count) / points)
+    raise ValueError('unknown sweep type {}'.format(kind))
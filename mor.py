@@ -0,0 +1,186 @@
+import hashlib
+import os
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+# Model order reduction of RLC(K) interconnect with PRIMA
+# The port impedance Z(s) = B.T*(G + s*C)^-1*B of the full MNA system is
+# projected onto a block Krylov space of (G + s0*C)^-1*C, which matches
+# the first q block moments of Z(s) around s0. Because the projection is a
+# congruence on an MNA system with G + G.T >= 0 and C = C.T >= 0, the
+# reduced model stays passive.
+
+# element types PRIMA can reduce, current sources are dropped (open circuit)
+PRIMA_TYPES = ('R', 'L', 'C', 'K', 'I')
+
+
+def port_matrices(ckt, ports):
+    """G, C and B of the passive MNA form for current injections at the port nodes.
+
+    The inductor branch rows are negated so that G + G.T and C are
+    positive semidefinite, which is what makes PRIMA passivity preserving.
+    """
+    other = [x for x in ckt.groups if x not in PRIMA_TYPES]
+    if other:
+        raise ValueError('PRIMA needs an R, L, C, K network, found {} elements'
+                         .format(', '.join(sorted(other))))
+    system = ckt.stamp()
+    n = ckt.num_nodes
+    sign = np.ones(system.size)
+    sign[n:] = -1
+    D = sparse.diags(sign)
+    B = np.zeros((system.size, len(ports)))
+    for j, nd in enumerate(ports):
+        if not 1 <= nd <= n:
+            raise ValueError('port node {:d} is not in the circuit'.format(nd))
+        B[nd - 1, j] = 1
+    return (D @ system.G).tocsc(), (D @ system.C).tocsc(), B
+
+
+class ReducedModel:
+    """Reduced order macromodel, Z(s) ~ Br.T*(Gr + s*Cr)^-1*Br."""
+
+    def __init__(self, Gr, Cr, Br, ports, s0, full_size, error=None, tol=None):
+        self.Gr = Gr
+        self.Cr = Cr
+        self.Br = Br
+        self.ports = list(ports)
+        self.s0 = s0
+        self.full_size = full_size
+        self.error = error   # max relative error at the check frequencies
+        self.tol = tol       # requested error, None when the number of moments was fixed
+
+    @property
+    def size(self):
+        return self.Gr.shape[0]
+
+    @property
+    def converged(self):
+        """False when a tolerance was asked for and not reached within max_moments."""
+        return self.tol is None or (self.error is not None and self.error <= self.tol)
+
+    def Z(self, freqs):
+        """Port impedance matrices, shape (len(freqs), ports, ports)."""
+        s = 2j * np.pi * np.asarray(freqs, dtype=float)
+        A = self.Gr[None] + s[:, None, None] * self.Cr[None]
+        Br = np.broadcast_to(self.Br, (len(s),) + self.Br.shape)
+        return np.swapaxes(Br, 1, 2) @ np.linalg.solve(A, Br)
+
+    def save(self, path):
+        np.savez(path, Gr=self.Gr, Cr=self.Cr, Br=self.Br, ports=np.array(self.ports),
+                 s0=self.s0, full_size=self.full_size,
+                 error=np.nan if self.error is None else self.error,
+                 tol=np.nan if self.tol is None else self.tol)
+
+    @classmethod
+    def load(cls, path):
+        d = np.load(path)
+        error = float(d['error'])
+        tol = float(d['tol']) if 'tol' in d.files else np.nan
+        return cls(d['Gr'], d['Cr'], d['Br'], [int(p) for p in d['ports']], float(d['s0']),
+                   int(d['full_size']), None if np.isnan(error) else error,
+                   None if np.isnan(tol) else tol)
+
+
+def full_impedance(G, C, B, freqs):
+    """Port impedance of the full sparse system, one sparse LU per frequency."""
+    out = []
+    for f in freqs:
+        lu = splu((G + 2j * np.pi * f * C).astype(complex).tocsc())
+        out.append(B.T @ lu.solve(B.astype(complex)))
+    return np.array(out)
+
+
+def _orthonormalize(V, basis):
+    # block modified Gram-Schmidt against the basis so far, twice for stability
+    # the deflation test is relative to the block before orthogonalization,
+    # Krylov blocks of nH/pF interconnect have norms around 1e-8
+    scale = np.linalg.norm(V, axis=0).max() if V.size else 0.0
+    for _ in range(2):
+        for Q in basis:
+            V = V - Q @ (Q.T @ V)
+    Q, R = np.linalg.qr(V)
+    # drop directions that were already in the space (deflation)
+    keep = np.abs(np.diag(R)) > 1e-10 * scale
+    return Q[:, keep]
+
+
+def prima(ckt, ports, moments=None, tol=None, fmax=1e9, s0=None, max_moments=50):
+    """Reduce the circuit seen from the port nodes with PRIMA.
+
+    moments fixes the number of block moments. With tol instead, blocks are
+    added until the max relative error against the full model at the check
+    frequencies (fmax/1e4 .. fmax) is below tol. The error of the returned
+    model is always measured and stored in ReducedModel.error, and
+    ReducedModel.converged is False when tol was not met in max_moments blocks.
+    """
+    if moments is None and tol is None:
+        moments = 4
+    G, C, B = port_matrices(ckt, ports)
+    if s0 is None:
+        s0 = 0.0
+        try:
+            lu = splu(G)
+        except RuntimeError:
+            # G is singular when a node has no DC path, expand about a real shift instead
+            s0 = 2 * np.pi * fmax * 1e-2
+            lu = splu((G + s0 * C).tocsc())
+    else:
+        lu = splu((G + s0 * C).tocsc())
+
+    check = fmax * 10.0 ** np.linspace(-4, 0, 13)
+    Zfull = full_impedance(G, C, B, check)
+
+    def build(X):
+        Gr, Cr, Br = X.T @ (G @ X), X.T @ (C @ X), X.T @ B
+        model = ReducedModel(Gr, Cr, Br, ports, s0, G.shape[0], tol=tol)
+        Zr = model.Z(check)
+        model.error = float(np.abs(Zr - Zfull).max() / np.abs(Zfull).max())
+        return model
+
+    basis = [_orthonormalize(lu.solve(B), [])]
+    limit = moments if moments is not None else max_moments
+    model = None
+    while True:
+        X = np.hstack(basis)
+        if tol is not None or len(basis) == limit:
+            model = build(X)
+            if (tol is not None and model.error <= tol) or len(basis) >= limit:
+                return model
+        V = _orthonormalize(lu.solve(C @ basis[-1]), basis)
+        if V.shape[1] == 0:
+            # no new directions, the Krylov space is invariant and the model
+            # should be exact, its measured error still decides converged
+            return build(X)
+        basis.append(V)
+
+
+def _system_key(ckt, ports, params):
+    G, C, B = port_matrices(ckt, ports)
+    h = hashlib.sha1(repr((ports, params)).encode())
+    for M in (G, C):
+        M = M.tocsr()
+        M.sort_indices()
+        for a in (M.indptr, M.indices, M.data):
+            h.update(np.ascontiguousarray(a).tobytes())
+    return h.hexdigest()[:20]
+
+
+class MacromodelCache:
+    """Reduced models on disk, keyed by the stamped matrices, ports and reduction settings."""
+
+    def __init__(self, cache_dir='mor_cache'):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, ckt, ports, moments=None, tol=None, fmax=1e9, s0=None):
+        """Cached ReducedModel, reduced and stored on a miss. Returns (model, hit)."""
+        key = _system_key(ckt, ports, (moments, tol, fmax, s0))
+        path = os.path.join(self.cache_dir, key + '.npz')
+        if os.path.exists(path):
+            return ReducedModel.load(path), True
+        model = prima(ckt, ports, moments, tol, fmax, s0)
+        model.save(path)
+        return model, False
@@ -0,0 +1,166 @@
+import numpy as np
+from scipy import sparse
+
+from mna import Factorization
+
+# Small signal noise analysis
+# Every noise source k is an independent current (or branch voltage) with
+# power spectral density S_k(f) entering A*x through an incidence column n_k.
+# With the adjoint solution A(s).T*lam = e of the output y = e.T*x, the
+# transfer from source k to the output is n_k.T*lam, so one adjoint solve per
+# frequency gives every transfer function and S_out = sum_k |n_k.T*lam|^2*S_k.
+# Small systems are solved for all frequencies at once as a stack of dense
+# matrices, large ones with one sparse LU per frequency.
+
+BOLTZMANN = 1.380649e-23
+# spice default temperature, 27 C
+TEMP = 300.15
+# systems larger than this use a sparse LU per frequency
+DENSE_LIMIT = 400
+# bytes of the stacked dense matrices solved in one batch
+BATCH_BYTES = 64 * 2 ** 20
+
+# element types that can be given a noise spec, E/H add a voltage in series
+# with their output, G/F a current in parallel
+NOISE_SPEC_TYPES = ('E', 'F', 'G', 'H')
+
+
+class NoiseResult:
+    """Noise spectra of one output, per frequency and per noise source.
+
+    psd has shape (frequencies, sources) and holds each source's
+    contribution to the output PSD (V^2/Hz or A^2/Hz). gain is the transfer
+    function from the input source to the output, for input referred noise.
+    """
+
+    def __init__(self, output, source, freqs, names, psd, gain):
+        self.output = output
+        self.source = source
+        self.freqs = freqs
+        self.names = names
+        self.psd = psd
+        self.gain = gain
+
+    @property
+    def output_psd(self):
+        return self.psd.sum(axis=1)
+
+    @property
+    def input_psd(self):
+        with np.errstate(divide='ignore'):
+            return self.output_psd / np.abs(self.gain) ** 2
+
+    def integrated(self):
+        """Total output noise power over the sweep and the part of each source."""
+        parts = _integrate(self.freqs, self.psd)
+        return float(parts.sum()), parts
+
+    def integrated_input(self):
+        """Input referred noise power over the sweep."""
+        return float(_integrate(self.freqs, self.input_psd[:, None])[0])
+
+
+def _integrate(freqs, psd):
+    # trapezoid rule over frequency, one value per column of psd
+    if len(freqs) < 2:
+        return np.zeros(psd.shape[1])
+    return ((psd[1:] + psd[:-1]) / 2 * np.diff(freqs)[:, None]).sum(axis=0)
+
+
+def _find(names, name, what):
+    for k, el in enumerate(names):
+        if el.lower() == name.lower():
+            return k
+    raise ValueError('.noise {} {} not found'.format(what, name))
+
+
+def noise_sources(ckt, system, specs=None, temp=TEMP):
+    """Noise source names, their incidence columns (sparse, unknowns x sources) and PSD function.
+
+    specs maps a controlled source name to (density, flicker corner), the
+    density in V/sqrt(Hz) or A/sqrt(Hz). psd(freqs) returns (frequencies, sources).
+    """
+    n = ckt.num_nodes
+    names, rows, cols, vals = [], [], [], []
+    white, corner = [], []
+
+    def add(name, entries, density, fc=0.0):
+        k = len(names)
+        names.append(name)
+        for r, v in entries:
+            if r >= 0:
+                rows.append(r)
+                cols.append(k)
+                vals.append(v)
+        white.append(density)
+        corner.append(fc)
+
+    if 'R' in ckt.groups:
+        g = ckt.groups['R']
+        # thermal noise current 4kT/R between the resistor nodes
+        for name, p, q, r in zip(g.names, g.p, g.n, g.value):
+            add(name, [(p - 1, 1.0), (q - 1, -1.0)], 4 * BOLTZMANN * temp / r)
+    for name, (density, fc) in (specs or {}).items():
+        x, j = None, None
+        for t in NOISE_SPEC_TYPES:
+            if t in ckt.groups:
+                for k, el in enumerate(ckt.groups[t].names):
+                    if el.lower() == name.lower():
+                        x, j = t, k
+        if x is None:
+            raise ValueError('noise spec for {}, which is not an E, F, G or H source'.format(name))
+        g = ckt.groups[x]
+        if x in ('E', 'H'):
+            entries = [(n + g.branch[j], 1.0)]
+        else:
+            entries = [(g.p[j] - 1, 1.0), (g.n[j] - 1, -1.0)]
+        add(g.names[j], entries, density ** 2, fc)
+
+    Ninc = sparse.csc_matrix((vals, (rows, cols)), shape=(system.size, len(names)))
+    white, corner = np.array(white), np.array(corner)
+
+    def psd(freqs):
+        f = np.asarray(freqs, dtype=float)[:, None]
+        # white density with an optional 1/f part below the corner frequency
+        with np.errstate(divide='ignore'):
+            return white[None, :] * (1 + np.where(corner > 0, corner[None, :] / f, 0.0))
+    return names, Ninc, psd
+
+
+def adjoint_solutions(system, e, freqs):
+    """lam with A(s).T*lam = e at every frequency, shape (frequencies, unknowns)."""
+    s = 2j * np.pi * np.asarray(freqs, dtype=float)
+    N = system.size
+    if N > DENSE_LIMIT:
+        return np.array([Factorization((system.G + sk * system.C).tocsc()).solve_transposed(e.astype(complex))
+                         for sk in s])
+    G, C = system.G.toarray().T, system.C.toarray().T
+    lam = np.empty((len(s), N), dtype=complex)
+    batch = max(1, BATCH_BYTES // (16 * N * N))
+    for first in range(0, len(s), batch):
+        sb = s[first:first + batch]
+        # the transposed matrices of every frequency in the batch, solved together
+        At = G[None] + sb[:, None, None] * C[None]
+        lam[first:first + len(sb)] = np.linalg.solve(At, np.broadcast_to(e, (len(sb), N))[:, :, None])[:, :, 0]
+    return lam
+
+
+def noise(ckt, output, source, freqs, specs=None, system=None, temp=TEMP):
+    """Output and input referred noise of ckt, see NoiseResult.
+
+    output is a spec such as V(3), V(3,5) or I(V1), source the independent
+    source the noise is referred to.
+    """
+    if system is None:
+        system = ckt.stamp()
+    e = system.output_vector(output)
+    col = _find(system.sources, source, 'input source')
+    freqs = np.asarray(freqs, dtype=float)
+    names, Ninc, psd = noise_sources(ckt, system, specs, temp)
+
+    lam = adjoint_solutions(system, e, freqs)
+    # transfer of every noise source and of the input, from the one adjoint solution
+    T = (Ninc.T @ lam.T).T if len(names) else np.zeros((len(freqs), 0))
+    gain = lam @ system.S[:, col].toarray().ravel()
+    contrib = np.abs(T) ** 2 * psd(freqs)
+    return NoiseResult(output, system.sources[col], freqs, names, contrib, gain)
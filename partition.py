@@ -0,0 +1,311 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import breadth_first_order
+
+from circuit import BRANCH_TYPES
+from mna import Factorization
+
+# Domain decomposition solve of the MNA system
+# The node graph of the netlist is cut into subdomains by recursive BFS
+# bisection. Unknowns that couple two subdomains form the interface B, the
+# rest are interior to one subdomain and the matrix is block bordered:
+#
+#   [A_11           A_1B] [x_1]   [b_1]
+#   [      A_22     A_2B] [x_2] = [b_2]
+#   [A_B1  A_B2 ... A_BB] [x_B]   [b_B]
+#
+# Each subdomain is factored in its own worker process and sends back its
+# part of the Schur complement S = A_BB - sum A_Bi*A_ii^-1*A_iB. The small
+# interface system S*x_B = b_B - sum A_Bi*A_ii^-1*b_i is solved here and the
+# workers finish with x_i = A_ii^-1*(b_i - A_iB*x_B) from the LU they kept.
+
+# interface systems up to this size are solved dense
+DENSE_INTERFACE = 3000
+
+
+def _bisect(adj, nodes, parts, labels, first):
+    # label nodes first .. first+parts-1, halves are split along a BFS ordering
+    if parts == 1 or len(nodes) <= 1:
+        labels[nodes] = first
+        return
+    sub = adj[nodes][:, nodes]
+    seen = np.zeros(len(nodes), dtype=bool)
+    order = []
+    for start in range(len(nodes)):
+        if seen[start]:
+            continue
+        # start from a pseudo peripheral node so the BFS levels run across the domain
+        far = breadth_first_order(sub, start, directed=False, return_predecessors=False)[-1]
+        comp = breadth_first_order(sub, far, directed=False, return_predecessors=False)
+        seen[comp] = True
+        order.append(comp)
+    order = np.concatenate(order)
+    left = parts // 2
+    cut = len(nodes) * left // parts
+    _bisect(adj, nodes[order[:cut]], left, labels, first)
+    _bisect(adj, nodes[order[cut:]], parts - left, labels, first + left)
+
+
+def partition_nodes(ckt, parts):
+    """Subdomain of each node (index 0 is ground, labelled -1)."""
+    n = ckt.num_nodes
+    rows, cols = [], []
+    for x, g in ckt.groups.items():
+        if x == 'K':
+            continue
+        pairs = [(g.vout, g.p), (g.vout, g.n)] if x == 'O' else [(g.p, g.n)]
+        if g.cp is not None:
+            pairs += [(g.p, g.cp), (g.p, g.cn)]
+        for a, b in pairs:
+            rows.append(a)
+            cols.append(b)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    # ground touches everything, it is not part of the graph
+    keep = (rows != 0) & (cols != 0) & (rows != cols)
+    adj = sparse.coo_matrix((np.ones(keep.sum()), (rows[keep] - 1, cols[keep] - 1)), shape=(n, n)).tocsr()
+    adj = adj + adj.T
+    labels = np.zeros(n + 1, dtype=np.int32)
+    _bisect(adj, np.arange(n), max(1, min(parts, n)), labels[1:], 0)
+    labels[0] = -1
+    return labels
+
+
+class Partition:
+    """Interior unknowns of each subdomain and the interface unknowns."""
+
+    def __init__(self, interiors, interface, cut_edges):
+        self.interiors = interiors
+        self.interface = interface
+        self.cut_edges = cut_edges
+
+    @property
+    def parts(self):
+        return len(self.interiors)
+
+
+def partition_system(ckt, A, parts):
+    """Partition of the unknowns of the MNA matrix A of ckt into subdomains."""
+    n = ckt.num_nodes
+    size = A.shape[0]
+    node_labels = partition_nodes(ckt, parts)
+    labels = np.empty(size, dtype=np.int32)
+    labels[:n] = node_labels[1:]
+    # a branch current lives with its element's nodes
+    for x in BRANCH_TYPES:
+        if x not in ckt.groups:
+            continue
+        g = ckt.groups[x]
+        nd = g.vout if x == 'O' else np.where(g.p != 0, g.p, g.n)
+        labels[n + g.branch] = np.maximum(node_labels[nd], 0)
+
+    P = abs(sparse.csr_matrix(A))
+    P = (P + P.T).tocoo()
+    cross = labels[P.row] != labels[P.col]
+    # one end of every edge between subdomains moves to the interface
+    interface = np.zeros(size, dtype=bool)
+    interface[np.where(labels[P.row] > labels[P.col], P.row, P.col)[cross]] = True
+    # an interior unknown with no diagonal (a branch current) needs its partner
+    # unknowns in the same block, otherwise that block is singular
+    P = P.tocsr()
+    no_diag = sparse.csr_matrix(A).diagonal() == 0
+    while True:
+        move = no_diag & ~interface & (P @ interface.astype(float) > 0)
+        if not move.any():
+            break
+        interface |= move
+    interiors = [np.flatnonzero((labels == k) & ~interface) for k in range(labels.max() + 1)]
+    return Partition([ix for ix in interiors if len(ix)], np.flatnonzero(interface), int(cross.sum()) // 2)
+
+
+def _eliminate(block):
+    # factor one subdomain, returns the LU and its Schur complement terms
+    A_ii, A_iB, A_Bi, b_i = block
+    lu = Factorization(A_ii)
+    Y = lu.solve(A_iB.toarray())
+    z = lu.solve(b_i)
+    return lu, A_Bi @ Y, A_Bi @ z
+
+
+def _domain_worker(conn, blocks):
+    # one process, one or more subdomains: eliminate, wait for x_B, back substitute
+    # every message is (status, payload), status 'ok' or 'error'
+    try:
+        lus = []
+        out = []
+        for block in blocks:
+            lu, S_i, g_i = _eliminate(block)
+            lus.append(lu)
+            out.append((S_i, g_i))
+        conn.send(('ok', out))
+        xBs = conn.recv()
+        conn.send(('ok', [lu.solve(b_i - A_iB @ xB)
+                          for lu, (_, A_iB, _, b_i), xB in zip(lus, blocks, xBs)]))
+    except EOFError:
+        # the parent gave up on the solve
+        pass
+    except Exception as e:
+        conn.send(('error', '{}: {}'.format(type(e).__name__, e)))
+    finally:
+        conn.close()
+
+
+def _receive(conn):
+    # payload of a worker message, a failed or vanished worker is a LinAlgError
+    # so the solve falls back to a direct LU
+    try:
+        status, payload = conn.recv()
+    except (EOFError, OSError):
+        raise np.linalg.LinAlgError('a subdomain worker exited without a result')
+    if status != 'ok':
+        raise np.linalg.LinAlgError(payload)
+    return payload
+
+
+class PartitionedSolver:
+    """Schur complement solve of A*x = b over the subdomains of a Partition.
+
+    workers is the number of processes (one per subdomain at most), 0 runs
+    every subdomain in this process. stats holds the partition and timing
+    of the last solve.
+    """
+
+    def __init__(self, A, partition, workers=None):
+        self.A = sparse.csr_matrix(A)
+        self.partition = partition
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = min(workers, partition.parts)
+        self.stats = {}
+        self.procs = []
+
+    def _blocks(self, b):
+        A, B = self.A, self.partition.interface
+        A_B = A[B]
+        blocks, rows, cols = [], [], []
+        for ix in self.partition.interiors:
+            A_i = A[ix]
+            A_iB = A_i[:, B].tocsc()
+            A_Bi = A_B[:, ix].tocsr()
+            # only the interface unknowns this subdomain touches
+            c = np.flatnonzero(np.diff(A_iB.indptr))
+            r = np.flatnonzero(np.diff(A_Bi.indptr))
+            blocks.append((A_i[:, ix].tocsc(), A_iB[:, c].tocsr(), A_Bi[r], b[ix]))
+            rows.append(r)
+            cols.append(c)
+        return blocks, rows, cols, A_B[:, B]
+
+    def _stop(self):
+        # close the pipes and end every worker, used after a failure as well
+        for p, conn in self.procs:
+            conn.close()
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        self.procs = []
+
+    def _run(self, blocks):
+        # eliminate every block, returns the (S_i, g_i) terms and a back substitution function
+        if self.workers <= 1:
+            done = [_eliminate(bl) for bl in blocks]
+
+            def back(xBs):
+                return [lu.solve(bl[3] - bl[1] @ xB) for (lu, _, _), bl, xB in zip(done, blocks, xBs)]
+            return [(S_i, g_i) for _, S_i, g_i in done], back
+
+        ctx = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        assign = [list(range(w, len(blocks), self.workers)) for w in range(self.workers)]
+        for idx in assign:
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=_domain_worker, args=(child, [blocks[k] for k in idx]))
+            p.start()
+            child.close()
+            self.procs.append((p, parent))
+        terms = [None] * len(blocks)
+        for idx, (p, conn) in zip(assign, self.procs):
+            for k, t in zip(idx, _receive(conn)):
+                terms[k] = t
+
+        def back(xBs):
+            xs = [None] * len(blocks)
+            for idx, (p, conn) in zip(assign, self.procs):
+                conn.send([xBs[k] for k in idx])
+            for idx, (p, conn) in zip(assign, self.procs):
+                for k, x in zip(idx, _receive(conn)):
+                    xs[k] = x
+            self._stop()
+            return xs
+        return terms, back
+
+    def _interface(self, terms, rows, cols, b, A_BB):
+        # x_B from S = A_BB - sum of the scattered subdomain terms
+        nB = A_BB.shape[0]
+        ri, ci, vals = [], [], []
+        g = b[self.partition.interface].astype(np.result_type(b.dtype, *[g_i.dtype for _, g_i in terms]))
+        for (S_i, g_i), r, c in zip(terms, rows, cols):
+            rr, cc = np.meshgrid(r, c, indexing='ij')
+            ri.append(rr.ravel())
+            ci.append(cc.ravel())
+            vals.append(S_i.ravel())
+            g[r] -= g_i
+        if not nB:
+            # the subdomains are not coupled at all
+            return g
+        corr = sparse.coo_matrix((np.concatenate(vals), (np.concatenate(ri), np.concatenate(ci))),
+                                 shape=(nB, nB))
+        S = A_BB - corr
+        return Factorization(S.toarray() if nB <= DENSE_INTERFACE else S.tocsc()).solve(g)
+
+    def solve(self, b):
+        b = np.asarray(b)
+        part, B = self.partition, self.partition.interface
+        t0 = time.perf_counter()
+        blocks, rows, cols, A_BB = self._blocks(b)
+        t1 = time.perf_counter()
+        self.stats = {
+            'parts': part.parts,
+            'workers': self.workers,
+            'unknowns': self.A.shape[0],
+            'interface': len(B),
+            'interior': [len(ix) for ix in part.interiors],
+            'cut_edges': part.cut_edges,
+            'fallback': None,
+        }
+        sizes = self.stats['interior']
+        self.stats['imbalance'] = max(sizes) / np.mean(sizes) if sizes else 1.0
+        try:
+            terms, back = self._run(blocks)
+            t2 = time.perf_counter()
+            xB = self._interface(terms, rows, cols, b, A_BB)
+            t3 = time.perf_counter()
+            xs = back([xB[c] for c in cols])
+        except np.linalg.LinAlgError as e:
+            # a singular subdomain or a failed worker, solve the whole system directly instead
+            self._stop()
+            self.stats['fallback'] = str(e)
+            x = Factorization(self.A.tocsc()).solve(b)
+            self.stats['times'] = {'direct': time.perf_counter() - t0}
+            return x
+        x = np.zeros(b.shape, dtype=np.result_type(xB.dtype, *[xi.dtype for xi in xs]))
+        x[B] = xB
+        for ix, xi in zip(part.interiors, xs):
+            x[ix] = xi
+        t4 = time.perf_counter()
+        self.stats['times'] = {'blocks': t1 - t0, 'subdomains': t2 - t1,
+                               'interface': t3 - t2, 'back substitution': t4 - t3}
+        return x
+
+
+def partitioned_solve(ckt, system, parts, workers=None):
+    """Solve the DC operating point of system with parts subdomains, returns (x, stats)."""
+    t0 = time.perf_counter()
+    A = system.A()
+    partition = partition_system(ckt, A, parts)
+    t1 = time.perf_counter()
+    solver = PartitionedSolver(A, partition, workers)
+    x = solver.solve(system.Z())
+    solver.stats['times'] = {'partition': t1 - t0, **solver.stats['times']}
+    return x, solver.stats
@@ -0,0 +1,229 @@
+from circuit import TOKEN_COUNT, Circuit, clean_netlist
+
+# Structural checks run on the parsed netlist before any matrix is built
+# Connectivity is tracked with disjoint sets, so the checks are close to
+# linear in the number of elements
+
+# element types whose branch is defined by a voltage (a loop of these is singular)
+VOLTAGE_TYPES = ('V', 'E', 'H')
+# element types whose branch is defined by a current (a cutset of these is singular)
+CURRENT_TYPES = ('I', 'G', 'F')
+
+# tokens holding node numbers on each kind of line, K lines name inductors instead
+NODE_TOKENS = {'O': slice(1, 4), 'E': slice(1, 5), 'G': slice(1, 5), 'K': slice(0, 0)}
+
+
+class Diagnostic:
+    """One problem found in the netlist, severity is 'error' or 'warning'."""
+    __slots__ = ('severity', 'code', 'element', 'node', 'message')
+
+    def __init__(self, severity, code, message, element=None, node=None):
+        self.severity = severity
+        self.code = code
+        self.element = element
+        self.node = node
+        self.message = message
+
+    def as_dict(self):
+        return {a: getattr(self, a) for a in self.__slots__}
+
+    def __repr__(self):
+        return '{}: {} ({})'.format(self.severity, self.message, self.code)
+
+
+class DisjointSet:
+    """Union-find over node numbers with path halving and union by size."""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, a):
+        parent = self.parent
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def union(self, a, b):
+        """Join the sets of a and b, False if they were already joined."""
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+
+def check_lines(content):
+    """Token count and element type of each cleaned netlist line."""
+    diags = []
+    for i, line in enumerate(content):
+        tk = line.split()
+        x = tk[0][0]
+        if x not in TOKEN_COUNT:
+            diags.append(Diagnostic('error', 'unknown-element',
+                                    'unknown element type in line {:d}, {:s}'.format(i, line), tk[0]))
+            continue
+        if len(tk) != TOKEN_COUNT[x]:
+            diags.append(Diagnostic('error', 'bad-format',
+                                    '{:s} has {:d} items and should have {:d}'.format(tk[0], len(tk), TOKEN_COUNT[x]),
+                                    tk[0]))
+            continue
+        for t in tk[NODE_TOKENS.get(x, slice(1, 3))]:
+            if not t.isdigit():
+                diags.append(Diagnostic('error', 'bad-node',
+                                        '{:s} has node {:s}, nodes must be non negative integers'.format(tk[0], t),
+                                        tk[0]))
+                break
+        else:
+            # values are the last token, except for op amps
+            if x != 'O':
+                try:
+                    float(tk[-1])
+                except ValueError:
+                    diags.append(Diagnostic('error', 'bad-value',
+                                            '{:s} has value {:s}, which is not a number'.format(tk[0], tk[-1]),
+                                            tk[0]))
+    return diags
+
+
+def _branches(ckt, kinds):
+    # (element name, p node, n node) of the conducting branches of the given types
+    for x in kinds:
+        if x not in ckt.groups:
+            continue
+        g = ckt.groups[x]
+        if x == 'O':
+            # the op amp output is driven against ground
+            for name, nd in zip(g.names, g.vout):
+                yield name, int(nd), 0
+        else:
+            for name, p, n in zip(g.names, g.p, g.n):
+                yield name, int(p), int(n)
+
+
+def check_circuit(ckt):
+    """Structural diagnostics of a parsed circuit."""
+    diags = []
+    nn = ckt.num_nodes + 1
+
+    # names and references
+    seen = set()
+    for x, j in ckt.order:
+        name = ckt.groups[x].names[j]
+        if name in seen:
+            diags.append(Diagnostic('error', 'duplicate-name',
+                                    'element name {:s} is used more than once'.format(name), name))
+        seen.add(name)
+    branch_names = set(ckt.branch_names)
+    for x in ('F', 'H'):
+        if x in ckt.groups:
+            g = ckt.groups[x]
+            for name, ctrl in zip(g.names, g.ctrl):
+                if ctrl not in branch_names:
+                    diags.append(Diagnostic('error', 'unknown-reference',
+                                            '{:s} is controlled by {:s}, which is not an element with a branch current'
+                                            .format(name, ctrl), name))
+    if 'K' in ckt.groups:
+        g = ckt.groups['K']
+        inductors = set(ckt.groups['L'].names) if 'L' in ckt.groups else set()
+        for name, l1, l2, k in zip(g.names, g.ctrl, g.ctrl2, g.value):
+            for ref in (l1, l2):
+                if ref not in inductors:
+                    diags.append(Diagnostic('error', 'unknown-reference',
+                                            '{:s} couples {:s}, which is not an inductor'.format(name, ref), name))
+            if not 0 <= k <= 1:
+                diags.append(Diagnostic('warning', 'coupling-range',
+                                        '{:s} has coupling {:g}, outside 0..1'.format(name, k), name))
+
+    missing = ckt.missing_nodes()
+    for nd in missing:
+        diags.append(Diagnostic('error', 'missing-node',
+                                'nodes not in continuous order, node {:d} is missing'.format(nd), node=nd))
+
+    # connectivity, a node must reach ground through some element
+    conducting = ('R', 'L', 'C', 'O') + VOLTAGE_TYPES
+    every = DisjointSet(nn)
+    for _, p, n in _branches(ckt, conducting + CURRENT_TYPES):
+        every.union(p, n)
+    without_current = DisjointSet(nn)
+    for _, p, n in _branches(ckt, conducting):
+        without_current.union(p, n)
+    dc = DisjointSet(nn)
+    for _, p, n in _branches(ckt, ('R', 'L', 'O') + VOLTAGE_TYPES):
+        dc.union(p, n)
+
+    touching = {}
+    for name, p, n in _branches(ckt, conducting + CURRENT_TYPES):
+        touching.setdefault(p, name)
+        touching.setdefault(n, name)
+    current_into = {}
+    for name, p, n in _branches(ckt, CURRENT_TYPES):
+        current_into.setdefault(without_current.find(p), name)
+        current_into.setdefault(without_current.find(n), name)
+
+    # each problem is reported once per connected group of nodes
+    missing = set(missing)
+    floating, cutsets, no_dc = set(), set(), set()
+    members = None
+    for nd in range(1, nn):
+        if nd in missing:
+            continue
+        root = every.find(nd)
+        if root != every.find(0):
+            if root not in floating:
+                floating.add(root)
+                if members is None:
+                    members = {}
+                    for k in range(1, nn):
+                        members.setdefault(every.find(k), []).append(k)
+                nodes = members[root]
+                diags.append(Diagnostic('error', 'floating-node',
+                                        'node {} has no connection to ground'.format(
+                                            ', '.join(str(k) for k in nodes)),
+                                        touching.get(nd), nd))
+            continue
+        root = without_current.find(nd)
+        if root != without_current.find(0):
+            if root not in cutsets:
+                cutsets.add(root)
+                diags.append(Diagnostic('error', 'current-source-cutset',
+                                        'node {:d} connects to ground only through current sources, such as {:s}'
+                                        .format(nd, current_into[root]), current_into[root], nd))
+            continue
+        root = dc.find(nd)
+        if root != dc.find(0) and root not in no_dc:
+            no_dc.add(root)
+            diags.append(Diagnostic('warning', 'no-dc-path',
+                                    'node {:d} has no DC path to ground, the DC operating point is singular'.format(nd),
+                                    touching.get(nd), nd))
+
+    # loops of voltage defined branches, sources first and then inductors
+    loops = DisjointSet(nn)
+    for name, p, n in _branches(ckt, VOLTAGE_TYPES + ('O',)):
+        if not loops.union(p, n):
+            diags.append(Diagnostic('error', 'voltage-loop',
+                                    '{:s} closes a loop of voltage sources'.format(name), name, p))
+    for name, p, n in _branches(ckt, ('L',)):
+        if not loops.union(p, n):
+            diags.append(Diagnostic('warning', 'inductor-loop',
+                                    '{:s} closes a loop of inductors and voltage sources, '
+                                    'the DC operating point is singular'.format(name), name, p))
+    return diags
+
+
+def preflight(lines):
+    """Check netlist lines before any heavy work, returns (circuit or None, diagnostics)."""
+    content = clean_netlist(lines)
+    diags = check_lines(content)
+    if any(d.severity == 'error' for d in diags):
+        return None, diags
+    ckt = Circuit.from_lines(content)
+    return ckt, diags + check_circuit(ckt)
+
+
+def has_errors(diags):
+    return any(d.severity == 'error' for d in diags)
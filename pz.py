@@ -0,0 +1,172 @@
+import numpy as np
+import scipy.linalg
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, eigs, splu
+
+# Pole-zero analysis of the numeric pencil A(s) = G + s*C
+# poles are the finite s with det(G + s*C) = 0, zeros of the transfer function
+# y = e.T*X from one source b are the finite s where the bordered pencil
+# [[G + s*C, b], [e.T, 0]] is singular
+
+# systems larger than this use shift-invert Arnoldi instead of the dense QZ solve
+DENSE_LIMIT = 400
+
+
+# poles whose |residue| is below this fraction of the largest one are hidden
+# (cancelled by a zero, or not reachable from the input or output)
+RESIDUE_TOL = 1e-9
+# a sparse eigenvalue s is accepted when |det(G + s*C)| is this much smaller
+# than at the probe points s +- PROBE*|s|, spurious Ritz values are not
+DET_RATIO = 1e-2
+PROBE = 1e-6
+
+
+class PoleZeroResult:
+    """Poles and zeros of one input/output pair, with stability flags.
+
+    When residues are known (dense solve) poles with a negligible residue are
+    hidden, they do not show in the transfer function, and stability and the
+    dominant pole (largest |residue|/|Re(p)|) come from the other poles.
+    Without residues the dominant pole is the one closest to the shift.
+    """
+
+    def __init__(self, poles, zeros, residues=None, tol=1e-9):
+        self.poles = poles
+        self.zeros = zeros
+        self.residues = residues
+        visible = np.ones(len(poles), dtype=bool)
+        if residues is not None and len(poles):
+            r = np.abs(residues)
+            top = r[np.isfinite(r)].max(initial=0.0)
+            visible = ~(r <= RESIDUE_TOL * top)
+        self.hidden = poles[~visible]
+        shown = poles[visible]
+        scale = max(1.0, np.abs(shown).max()) if len(shown) else 1.0
+        re = shown.real
+        self.stable = bool(np.all(re < -tol * scale))
+        self.marginal = bool(np.any(np.abs(re) <= tol * scale)) and not np.any(re > tol * scale)
+        self.unstable = bool(np.any(re > tol * scale))
+        if not len(shown):
+            self.dominant = None
+        elif residues is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.abs(residues[visible]) / np.abs(re)
+            self.dominant = shown[np.argmax(np.where(np.isnan(ratio), np.inf, ratio))]
+        else:
+            self.dominant = shown[0]
+
+
+def _finite(alpha, beta, tol=1e-10):
+    # homogeneous eigenvalues alpha/beta, beta ~ 0 is an infinite eigenvalue
+    alpha, beta = np.asarray(alpha), np.asarray(beta)
+    scale = np.maximum(np.abs(alpha), np.abs(beta))
+    keep = (np.abs(beta) > tol * scale) & (scale > 0)
+    return keep
+
+
+def _bordered(system, b, e):
+    # Rosenbrock system pencil of one input/output pair
+    n = system.size
+    G = sparse.bmat([[system.G, sparse.csr_matrix(b.reshape(-1, 1))],
+                     [sparse.csr_matrix(e.reshape(1, -1)), None]], format='csc')
+    C = sparse.bmat([[system.C, None], [None, sparse.csr_matrix((1, 1))]], format='csc')
+    return G, C
+
+
+def dense_eigs(G, C, left=False):
+    """Finite generalized eigenvalues of G + s*C = 0 by QZ."""
+    G = G.toarray() if sparse.issparse(G) else G
+    C = C.toarray() if sparse.issparse(C) else C
+    if left:
+        w, vl, vr = scipy.linalg.eig(G, -C, left=True, right=True, homogeneous_eigvals=True)
+    else:
+        w = scipy.linalg.eigvals(G, -C, homogeneous_eigvals=True)
+    keep = _finite(w[0], w[1])
+    vals = w[0][keep] / w[1][keep]
+    if left:
+        return vals, vl[:, keep], vr[:, keep]
+    return vals
+
+
+def _solve(lu, b):
+    # splu of a real matrix only takes real right hand sides
+    b = np.asarray(b)
+    if np.iscomplexobj(b) and lu.L.dtype.kind != 'c':
+        return lu.solve(np.ascontiguousarray(b.real)) + 1j * lu.solve(np.ascontiguousarray(b.imag))
+    return lu.solve(b)
+
+
+def _log_det(G, C, s):
+    # log|det(G + s*C)|, -inf when the LU breaks down at an exact eigenvalue
+    try:
+        lu = splu((G + s * C).astype(np.complex128).tocsc())
+    except RuntimeError:
+        return -np.inf
+    with np.errstate(divide='ignore'):
+        return float(np.log(np.abs(lu.U.diagonal())).sum())
+
+
+def _is_eigenvalue(G, C, s, h):
+    # det(G + s*C) has a root at s: it is much smaller there than h away from s
+    at = _log_det(G, C, s)
+    return all(at <= _log_det(G, C, s + d) + np.log(DET_RATIO) for d in (h, -h, 1j * h))
+
+
+def sparse_eigs(G, C, k=6, sigma=0.0):
+    """Up to k finite eigenvalues of G + s*C = 0 closest to sigma, by shift-invert Arnoldi.
+
+    (G + sigma*C)^-1 * C has eigenvalues nu = 1/(sigma - s), so the poles
+    nearest the shift are the largest nu.
+    """
+    G, C = sparse.csc_matrix(G), sparse.csc_matrix(C)
+    dtype = np.complex128 if np.iscomplexobj(sigma) else np.float64
+    lu = splu((G + sigma * C).astype(dtype).tocsc())
+    n = G.shape[0]
+    op = LinearOperator((n, n), matvec=lambda v: _solve(lu, C @ v), dtype=dtype)
+    k = min(k, n - 2)
+    nu, v = eigs(op, k=k, which='LM')
+    s = sigma - 1 / nu
+    # when k exceeds the number of finite eigenvalues the extra Ritz values
+    # come from the infinite ones (nu ~ 0, in Jordan blocks), they do not
+    # converge. Rounding turns such a block into a ring of finite looking
+    # values with a small residual, so every candidate is also checked
+    # against the determinant of the pencil
+    resid = np.linalg.norm(op.matmat(v) - v * nu, axis=0) / (np.abs(nu) * np.linalg.norm(v, axis=0))
+    # probe distance relative to s, near s = 0 to the spread of the eigenvalues ~ |G|/|C|
+    gc = abs(G).sum(axis=0).max() / max(abs(C).sum(axis=0).max(), np.finfo(float).tiny)
+    keep = [bool(r <= 1e-10) and _is_eigenvalue(G, C, sk, PROBE * (abs(sk) or abs(sigma) or gc))
+            for r, sk in zip(resid, s)]
+    s = s[np.array(keep, dtype=bool)]
+    return s[np.argsort(np.abs(s - sigma))]
+
+
+def pole_zero(system, source, output, method=None, k=6, sigma=0.0):
+    """Poles and zeros of the transfer function from a source to an output.
+
+    source is an independent source name (V1, I1), output is a spec such as
+    V(3) or I(V1). method is 'dense' or 'sparse', picked from the system
+    size when None.
+    """
+    name = source.capitalize()
+    if name not in system.sources:
+        raise ValueError('.pz input {} is not an independent source'.format(source))
+    b = system.S[:, system.sources.index(name)].toarray().ravel()
+    e = system.output_vector(output)
+    if method is None:
+        method = 'dense' if system.size <= DENSE_LIMIT else 'sparse'
+
+    Gb, Cb = _bordered(system, b, e)
+    if method == 'dense':
+        poles, vl, vr = dense_eigs(system.G, system.C, left=True)
+        # residue of each pole, H(s) ~ r/(s - p) near p
+        Cd = system.C.toarray()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            residues = (e @ vr) * (vl.conj().T @ b) / np.einsum('ij,ij->j', vl.conj(), Cd @ vr)
+        zeros = dense_eigs(Gb, Cb)
+        order = np.argsort(np.abs(poles))
+        return PoleZeroResult(poles[order], np.sort_complex(zeros), residues[order])
+    if method == 'sparse':
+        poles = sparse_eigs(system.G, system.C, k, sigma)
+        zeros = sparse_eigs(Gb, Cb, k, sigma)
+        return PoleZeroResult(poles, zeros)
+    raise ValueError('unknown pole-zero method {}'.format(method))
@@ -0,0 +1,205 @@
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+# Columnar binary store for simulation results
+# Each run is a directory with one raw little endian file per column and a
+# meta.json that lists the columns and the number of complete rows. Rows are
+# appended in chunks while the simulation runs, readers memory map the
+# column files and only touch the signals and rows they ask for.
+#
+#   results/<run id>/meta.json
+#   results/<run id>/c0.bin, c1.bin, ...
+#
+# Old runs are deleted when a new one is created: only the newest
+# RESULTS_KEEP runs are kept, none older than RESULTS_MAX_AGE seconds. Runs
+# younger than RESULTS_MIN_AGE seconds are never deleted for the count, so a
+# large batch does not lose its first runs before its response is read.
+
+RUN_ID = re.compile(r'^[0-9a-f]{16}$')
+
+# retention defaults, 0 turns a limit off
+KEEP_RUNS = 200
+MAX_AGE = 7 * 24 * 3600
+MIN_AGE = 3600
+
+
+def _write_json(path, data):
+    # write then rename, readers never see half a file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+class ResultWriter:
+    """Appends rows of a run chunk by chunk, meta.json is updated after every chunk."""
+
+    def __init__(self, path, run_id, columns, index=None, analysis=None, attrs=None):
+        self.path = path
+        self.run_id = run_id
+        self.rows = 0
+        self.meta = {
+            'run_id': run_id,
+            'analysis': analysis,
+            'index': index,
+            'rows': 0,
+            'complete': False,
+            'attrs': attrs or {},
+            'columns': [],
+        }
+        # column name -> (file path, dtype), a file is only open while a chunk is appended
+        # so runs with thousands of columns stay far below the open file limit
+        self.files = {}
+        for k, (name, dtype) in enumerate(columns):
+            dtype = np.dtype(dtype).newbyteorder('<')
+            fname = 'c{:d}.bin'.format(k)
+            self.meta['columns'].append({'name': name, 'dtype': dtype.str, 'file': fname})
+            self.files[name] = (os.path.join(path, fname), dtype)
+            open(self.files[name][0], 'wb').close()
+        _write_json(os.path.join(path, 'meta.json'), self.meta)
+
+    def append(self, chunk):
+        """Append rows, chunk maps every column name to an array of the same length."""
+        lengths = {len(np.atleast_1d(v)) for v in chunk.values()}
+        if set(chunk) != set(self.files) or len(lengths) != 1:
+            raise ValueError('a chunk needs every column with the same number of rows')
+        for name, (fpath, dtype) in self.files.items():
+            with open(fpath, 'ab') as f:
+                f.write(np.ascontiguousarray(np.atleast_1d(chunk[name]), dtype=dtype).tobytes())
+        self.rows += lengths.pop()
+        self.meta['rows'] = self.rows
+        _write_json(os.path.join(self.path, 'meta.json'), self.meta)
+
+    def close(self):
+        self.meta['complete'] = True
+        _write_json(os.path.join(self.path, 'meta.json'), self.meta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultSet:
+    """Read side of a run, columns are memory mapped on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.columns = [c['name'] for c in self.meta['columns']]
+        self.index = self.meta['index']
+        self.rows = self.meta['rows']
+
+    def column(self, name):
+        for c in self.meta['columns']:
+            if c['name'] == name:
+                if self.rows == 0:
+                    return np.zeros(0, dtype=c['dtype'])
+                # only the complete rows, a writer may be appending past them
+                return np.memmap(os.path.join(self.path, c['file']), dtype=c['dtype'],
+                                 mode='r', shape=(self.rows,))
+        raise KeyError('run {} has no column {}'.format(self.meta['run_id'], name))
+
+    def window(self, start=None, stop=None):
+        """Row slice or mask with start <= index <= stop, all rows without an index column."""
+        if self.index is None or (start is None and stop is None):
+            return slice(0, self.rows)
+        idx = self.column(self.index)
+        lo = -np.inf if start is None else start
+        hi = np.inf if stop is None else stop
+        if self.rows < 2 or np.all(idx[1:] >= idx[:-1]):
+            # sorted index (time, frequency, a single sweep), binary search
+            return slice(int(np.searchsorted(idx, lo, 'left')), int(np.searchsorted(idx, hi, 'right')))
+        # nested sweeps repeat the inner values
+        return np.flatnonzero((idx >= lo) & (idx <= hi))
+
+    def read(self, signals=None, start=None, stop=None):
+        """Selected columns (all by default) over the index window, as arrays."""
+        signals = self.columns if signals is None else list(signals)
+        rows = self.window(start, stop)
+        out = {}
+        if self.index is not None and self.index not in signals:
+            out[self.index] = np.array(self.column(self.index)[rows])
+        for name in signals:
+            out[name] = np.array(self.column(name)[rows])
+        return out
+
+
+class ResultStore:
+    """Directory of runs, one sub directory per run id.
+
+    keep is the number of runs kept and max_age the age in seconds after
+    which a run is deleted, both checked when a run is created. Runs younger
+    than min_age seconds are kept even past keep.
+    """
+
+    def __init__(self, root='results', keep=KEEP_RUNS, max_age=MAX_AGE, min_age=MIN_AGE):
+        self.root = root
+        self.keep = keep
+        self.max_age = max_age
+        self.min_age = min_age
+        os.makedirs(root, exist_ok=True)
+
+    def runs(self):
+        """(modification time, run id) of every run, oldest first."""
+        out = []
+        for run_id in os.listdir(self.root):
+            meta = os.path.join(self.root, run_id, 'meta.json')
+            if RUN_ID.match(run_id) and os.path.exists(meta):
+                out.append((os.path.getmtime(meta), run_id))
+        return sorted(out)
+
+    def prune(self, room=0):
+        """Delete runs past the age limit and the oldest runs over keep - room."""
+        runs = self.runs()
+        now = time.time()
+        drop = set()
+        if self.max_age:
+            drop.update(run_id for mtime, run_id in runs if mtime < now - self.max_age)
+        if self.keep:
+            over = runs[:max(0, len(runs) - self.keep + room)]
+            drop.update(run_id for mtime, run_id in over if mtime < now - self.min_age)
+        for run_id in drop:
+            # another process may be pruning the same run
+            shutil.rmtree(os.path.join(self.root, run_id), ignore_errors=True)
+        return sorted(drop)
+
+    def create(self, columns, index=None, analysis=None, attrs=None):
+        """New run with (name, dtype) columns, returns its ResultWriter."""
+        self.prune(room=1)
+        run_id = uuid.uuid4().hex[:16]
+        path = os.path.join(self.root, run_id)
+        os.makedirs(path)
+        return ResultWriter(path, run_id, columns, index, analysis, attrs)
+
+    def open(self, run_id):
+        if not RUN_ID.match(run_id) or not os.path.exists(os.path.join(self.root, run_id, 'meta.json')):
+            raise KeyError('unknown run {}'.format(run_id))
+        return ResultSet(os.path.join(self.root, run_id))
+
+
+def result_store():
+    """The store named by RESULTS_DIR, None when results are only printed."""
+    root = os.getenv('RESULTS_DIR')
+    if not root:
+        return None
+    return ResultStore(root, int(os.getenv('RESULTS_KEEP', KEEP_RUNS)),
+                       float(os.getenv('RESULTS_MAX_AGE', MAX_AGE)),
+                       float(os.getenv('RESULTS_MIN_AGE', MIN_AGE)))
+
+
+def save_operating_point(names, x):
+    """Store one operating point as a single row run, returns the run id or None without a store."""
+    store = result_store()
+    if store is None:
+        return None
+    with store.create([(nm, x.dtype) for nm in names], analysis='op') as w:
+        w.append(dict(zip(names, np.asarray(x)[:, None])))
+    return w.run_id
@@ -0,0 +1,132 @@
+import numpy as np
+
+from mna import Factorization
+
+# Adjoint sensitivity analysis
+# For A*x = Z and an output y = e.T*x, solving the adjoint system A.T*lam = e once
+# gives dy/dp = -lam.T*(dA/dp)*x + lam.T*(dZ/dp) for every element value p,
+# so all sensitivities cost one factorization and two (blocked) solves
+
+
+class SensitivityResult:
+    """Sensitivities of each output to each element value.
+
+    values holds the element value of each param, y has shape
+    (frequencies, outputs) and dy has shape (frequencies, params, outputs).
+    freqs is None for a DC analysis.
+    """
+
+    def __init__(self, params, values, outputs, freqs, y, dy):
+        self.params = params
+        self.values = values
+        self.outputs = outputs
+        self.freqs = freqs
+        self.y = y
+        self.dy = dy
+
+    def normalized(self):
+        """Relative sensitivities (p/y)*dy/dp."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.dy * self.values[None, :, None] / self.y[:, None, :]
+
+
+def _pad(a):
+    # node k lives in row k-1, ground (k=0) maps to row -1 which is a row of zeros
+    return np.concatenate([a, np.zeros((1,) + a.shape[1:], dtype=a.dtype)])
+
+
+def element_sensitivities(ckt, system, x, lam, s=0):
+    """dy/dp for every element from the solution x and adjoint solutions lam (one column per output).
+
+    Returns the parameter names, their values and an array (params, outputs).
+    """
+    n = ckt.num_nodes
+    xp, lp = _pad(x), _pad(lam)
+    names, values, rows = [], [], []
+
+    def add(g, d):
+        names.extend(g.names)
+        values.extend(g.value)
+        rows.append(d)
+
+    def vdiff(a, p, q):
+        # voltage between nodes p and q, for x (1d) or lam (2d)
+        return a[p - 1] - a[q - 1]
+
+    groups = ckt.groups
+    if 'R' in groups:
+        g = groups['R']
+        # dA/dg is the conductance stamp and dg/dR = -1/R^2
+        add(g, vdiff(lp, g.p, g.n) * (vdiff(xp, g.p, g.n) / g.value ** 2)[:, None])
+    if 'C' in groups:
+        g = groups['C']
+        add(g, -s * vdiff(lp, g.p, g.n) * vdiff(xp, g.p, g.n)[:, None])
+    if 'L' in groups:
+        g = groups['L']
+        k = n + g.branch
+        dL = s * lp[k] * xp[k][:, None]
+        if 'K' in groups:
+            # the mutual M = k*sqrt(L1*L2) also depends on both inductances
+            K = groups['K']
+            lidx = {name: j for j, name in enumerate(g.names)}
+            for j in range(len(K)):
+                j1, j2 = lidx[K.ctrl[j]], lidx[K.ctrl2[j]]
+                k1, k2 = k[j1], k[j2]
+                M = K.value[j] * np.sqrt(g.value[j1] * g.value[j2])
+                dM = s * (lp[k1] * xp[k2] + lp[k2] * xp[k1])
+                dL[j1] += dM * M / (2 * g.value[j1])
+                dL[j2] += dM * M / (2 * g.value[j2])
+        add(g, dL)
+    if 'K' in groups:
+        g = groups['K']
+        L = groups['L']
+        lidx = {name: j for j, name in enumerate(L.names)}
+        j1 = np.array([lidx[a] for a in g.ctrl])
+        j2 = np.array([lidx[b] for b in g.ctrl2])
+        k1, k2 = n + L.branch[j1], n + L.branch[j2]
+        dM = s * (lp[k1] * xp[k2][:, None] + lp[k2] * xp[k1][:, None])
+        add(g, dM * np.sqrt(L.value[j1] * L.value[j2])[:, None])
+    if 'G' in groups:
+        g = groups['G']
+        add(g, -vdiff(lp, g.p, g.n) * vdiff(xp, g.cp, g.cn)[:, None])
+    if 'E' in groups:
+        g = groups['E']
+        add(g, lp[n + g.branch] * vdiff(xp, g.cp, g.cn)[:, None])
+    for x in ('F', 'H'):
+        if x in groups:
+            g = groups[x]
+            ctrl = n + np.array([ckt.branch_index(name) for name in g.ctrl], dtype=np.int32)
+            add(g, lp[n + g.branch] * xp[ctrl][:, None])
+    # independent sources only enter Z
+    if 'V' in groups:
+        g = groups['V']
+        add(g, lp[n + g.branch])
+    if 'I' in groups:
+        g = groups['I']
+        add(g, -vdiff(lp, g.p, g.n))
+
+    dy = np.concatenate(rows) if rows else np.zeros((0, lam.shape[1]))
+    return names, np.array(values, dtype=float), dy
+
+
+def sensitivities(ckt, outputs, freqs=None, system=None):
+    """DC sensitivities, or AC sensitivities at each frequency in Hz if freqs is given."""
+    if system is None:
+        system = ckt.stamp()
+    E = np.column_stack([system.output_vector(o) for o in outputs])
+    Z = system.Z()
+    points = [0] if freqs is None else [2j * np.pi * f for f in freqs]
+    ys, dys = [], []
+    for s in points:
+        # sparse LU, a dense A would cost O(n^2) memory and O(n^3) time per point
+        A = system.A(s).tocsc()
+        lu = Factorization(A)
+        x = lu.solve(Z)
+        # one adjoint solve for all outputs
+        lam = lu.solve_transposed(E.astype(A.dtype))
+        names, values, dy = element_sensitivities(ckt, system, x, lam, s)
+        ys.append(E.T @ x)
+        dys.append(dy)
+    return SensitivityResult(names, values, list(outputs),
+                             None if freqs is None else np.asarray(freqs),
+                             np.array(ys), np.array(dys))
@@ -1,10 +1,15 @@
 import os
-from sympy import *
+import sys
 import numpy as np
-import pandas as pd
-import sympy as sp
+from circuit import Circuit, BRANCH_TYPES, netlist_directives
+from analyses import run_directives
+from mna import Factorization, source_incidence, solve_excitations
+from preflight import check_lines, check_circuit, has_errors
+from resultstore import save_operating_point
 
-init_printing()
+# ANALYSIS_MODE=numeric solves the stamped matrices directly, sympy and pandas
+# are only imported in the default symbolic mode
+analysis_mode = os.getenv('ANALYSIS_MODE', 'symbolic')
 
 # initialize variables
 num_rlc = 0 # number of passive elements
@@ -30,6 +35,9 @@ else:
     print("Error: NETLIST_PATH environment variable is not set")
 
 
+# keep the spice directives, the analyses they request run after the operating point
+directives = netlist_directives(content)
+
 # fn = 'test_1'    #coupled_ind'   #RCL circuit'     #opamp_test_circuit_426'   #example48-1a'
 # fd1 = open(fn+'.net','r')
 # content = fd1.readlines()
@@ -114,147 +122,27 @@ for i in range(line_cnt):
     else:
         print("unknown element type in branch {:d}, {:s}".format(i,content[i]))
 
-# build the pandas data frame
-df = pd.DataFrame(columns=['element','p node','n node','cp node','cn node',
-    'Vout','value','Vname','Lname1','Lname2'])
-
-# this data frame is for branches with unknown currents
-df2 = pd.DataFrame(columns=['element','p node','n node'])
-
-# loads voltage or current sources into branch structure
-def indep_source(line_nu):
-    tk = content[line_nu].split()
-    df.loc[line_nu,'element'] = tk[0]
-    df.loc[line_nu,'p node'] = int(tk[1])
-    df.loc[line_nu,'n node'] = int(tk[2])
-    df.loc[line_nu,'value'] = float(tk[3])
-
-# loads passive elements into branch structure
-def rlc_element(line_nu):
-    tk = content[line_nu].split()
-    df.loc[line_nu,'element'] = tk[0]
-    df.loc[line_nu,'p node'] = int(tk[1])
-    df.loc[line_nu,'n node'] = int(tk[2])
-    df.loc[line_nu,'value'] = float(tk[3])
-
-# loads multi-terminal elements into branch structure
-# O - Op Amps
-def opamp_sub_network(line_nu):
-    tk = content[line_nu].split()
-    df.loc[line_nu,'element'] = tk[0]
-    df.loc[line_nu,'p node'] = int(tk[1])
-    df.loc[line_nu,'n node'] = int(tk[2])
-    df.loc[line_nu,'Vout'] = int(tk[3])
-
-# G - VCCS
-def vccs_sub_network(line_nu):
-    tk = content[line_nu].split()
-    df.loc[line_nu,'element'] = tk[0]
-    df.loc[line_nu,'p node'] = int(tk[1])
-    df.loc[line_nu,'n node'] = int(tk[2])
-    df.loc[line_nu,'cp node'] = int(tk[3])
-    df.loc[line_nu,'cn node'] = int(tk[4])
-    df.loc[line_nu,'value'] = float(tk[5])
-
-# E - VCVS
-# in sympy E is the number 2.718, replacing E with Ea otherwise, sympify() errors out
-def vcvs_sub_network(line_nu):
-    tk = content[line_nu].split()
-    df.loc[line_nu,'element'] = tk[0].replace('E', 'Ea')
-    df.loc[line_nu,'p node'] = int(tk[1])
-    df.loc[line_nu,'n node'] = int(tk[2])
-    df.loc[line_nu,'cp node'] = int(tk[3])
-    df.loc[line_nu,'cn node'] = int(tk[4])
-    df.loc[line_nu,'value'] = float(tk[5])
-
-# F - CCCS
-def cccs_sub_network(line_nu):
-    tk = content[line_nu].split()
-    df.loc[line_nu,'element'] = tk[0]
-    df.loc[line_nu,'p node'] = int(tk[1])
-    df.loc[line_nu,'n node'] = int(tk[2])
-    df.loc[line_nu,'Vname'] = tk[3].capitalize()
-    df.loc[line_nu,'value'] = float(tk[4])
-
-# H - CCVS
-def ccvs_sub_network(line_nu):
-    tk = content[line_nu].split()
-    df.loc[line_nu,'element'] = tk[0]
-    df.loc[line_nu,'p node'] = int(tk[1])
-    df.loc[line_nu,'n node'] = int(tk[2])
-    df.loc[line_nu,'Vname'] = tk[3].capitalize()
-    df.loc[line_nu,'value'] = float(tk[4])
-
-# K - Coupled inductors
-def cpld_ind_sub_network(line_nu):
-    tk = content[line_nu].split()
-    df.loc[line_nu,'element'] = tk[0]
-    df.loc[line_nu,'Lname1'] = tk[1].capitalize()
-    df.loc[line_nu,'Lname2'] = tk[2].capitalize()
-    df.loc[line_nu,'value'] = float(tk[3])
-
-# function to scan df and get largest node number
-def count_nodes():
-    # need to check that nodes are consecutive
-    # fill array with node numbers
-    p = np.zeros(line_cnt+1)
-    for i in range(line_cnt):
-        # need to skip coupled inductor 'K' statements
-        if df.loc[i,'element'][0] != 'K': #get 1st letter of element name
-            p[df['p node'][i]] = df['p node'][i]
-            p[df['n node'][i]] = df['n node'][i]
-
-    # find the largest node number
-    if df['n node'].max() > df['p node'].max():
-        largest = df['n node'].max()
-    else:
-        largest =  df['p node'].max()
-
-    largest = int(largest)
-    # check for unfilled elements, skip node 0
-    for i in range(1,largest):
-        if p[i] == 0:
-            print('nodes not in continuous order, node {:.0f} is missing'.format(p[i-1]+1))
-
-    return largest
-
-# load branch info into data frame
-for i in range(line_cnt):
-    x = content[i][0]
+# structural checks (format, references, floating nodes, source loops and cutsets)
+# so a bad netlist is rejected before any matrix is built
+diags = check_lines(content)
+if not has_errors(diags):
+    # build the compact circuit model, element types are stored as arrays
+    # and element records are used to walk the netlist in order
+    ckt = Circuit.from_lines(content, directives)
+    diags += check_circuit(ckt)
+for d in diags:
+    print('{:s}: {:s}'.format(d.severity, d.message))
+if has_errors(diags):
+    print('netlist rejected by preflight checks', file=sys.stderr)
+    sys.exit(1)
+elements = ckt.elements
 
-    if (x == 'R') or (x == 'L') or (x == 'C'):
-        rlc_element(i)
-    elif (x == 'V') or (x == 'I'):
-        indep_source(i)
-    elif x == 'O':
-        opamp_sub_network(i)
-    elif x == 'E':
-        vcvs_sub_network(i)
-    elif x == 'G':
-        vccs_sub_network(i)
-    elif x == 'F':
-        cccs_sub_network(i)
-    elif x == 'H':
-        ccvs_sub_network(i)
-    elif x == 'K':
-        cpld_ind_sub_network(i)
-    else:
-        print("unknown element type in branch {:d}, {:s}".format(i,content[i]))
+# in sympy E is the number 2.718, replacing E with Ea otherwise, sympify() errors out
+def sym_name(el):
+    return el.name.replace('E', 'Ea') if el.kind == 'E' else el.name
 
-# count number of nodes
-num_nodes = count_nodes()
-
-# Build df2: consists of branches with current unknowns, used for C & D matrices
-# walk through data frame and find these parameters
-count = 0
-for i in range(len(df)):
-    # process all the elements creating unknown currents
-    x = df.loc[i,'element'][0]   #get 1st letter of element name
-    if (x == 'L') or (x == 'V') or (x == 'O') or (x == 'E') or (x == 'H') or (x == 'F'):
-        df2.loc[count,'element'] = df.loc[i,'element']
-        df2.loc[count,'p node'] = df.loc[i,'p node']
-        df2.loc[count,'n node'] = df.loc[i,'n node']
-        count += 1
+# count number of nodes, preflight already checked that nodes are consecutive
+num_nodes = ckt.num_nodes
 
 # print a report
 print('Net list report')
@@ -276,6 +164,47 @@ print('number of F - CCCS: {:d}'.format(num_cccs))
 print('number of H - CCVS: {:d}'.format(num_ccvs))
 print('number of K - Coupled inductors: {:d}'.format(num_cpld_ind))
 
+# numeric mode, solve the operating point and skip the symbolic matrices
+# parallel mode is numeric with the matrix split into SOLVER_PARTS subdomains
+if analysis_mode in ('numeric', 'parallel'):
+    mna_sys = ckt.stamp()
+    try:
+        if analysis_mode == 'parallel':
+            from partition import partitioned_solve
+            parts = int(os.getenv('SOLVER_PARTS', str(max(2, os.cpu_count() or 1))))
+            X_np, stats = partitioned_solve(ckt, mna_sys, parts)
+            print('Partitioned solve: {:d} subdomains on {:d} workers, {:d} unknowns'.format(
+                stats['parts'], stats['workers'], stats['unknowns']))
+            print('interface unknowns: {:d} ({:.1f}%), cut edges: {:d}'.format(
+                stats['interface'], 100 * stats['interface'] / stats['unknowns'], stats['cut_edges']))
+            print('interior unknowns: {:s}, imbalance {:.2f}'.format(
+                ' '.join(str(k) for k in stats['interior']), stats['imbalance']))
+            if stats['fallback']:
+                print('fallback to a direct solve: {:s}'.format(stats['fallback']))
+            print('time: {:s}'.format(', '.join('{:s} {:.4f} s'.format(k, v) for k, v in stats['times'].items())))
+        else:
+            X_np = Factorization(mna_sys.A()).solve(mna_sys.Z())
+    except np.linalg.LinAlgError as e:
+        # e.g. a node without a DC path to ground, preflight only warns about it,
+        # the directives below can still run
+        print('error: operating point failed: {}'.format(e))
+    else:
+        for i, val in enumerate(X_np):
+            print(f" {val:.4f} ")
+        # full precision copy of the operating point when RESULTS_DIR is set
+        run_id = save_operating_point(mna_sys.names, X_np)
+        if run_id is not None:
+            print('results: op {:s}'.format(run_id))
+    run_directives(ckt, mna_sys)
+    sys.exit(0)
+
+from sympy import *
+import sympy as sp
+
+init_printing()
+
+# data frames are only built for the report
+df, df2 = ckt.to_dataframe()
 print(df)
 print(df2)
 
@@ -302,19 +231,19 @@ Ev = zeros(i_unk,1)
 J = zeros(i_unk,1)
 
 # G matrix
-for i in range(len(df)):  # process each row in the data frame
-    n1 = df.loc[i,'p node']
-    n2 = df.loc[i,'n node']
-    cn1 = df.loc[i,'cp node']
-    cn2 = df.loc[i,'cn node']
+for el in elements:  # process each row in the data frame
+    n1 = el.p
+    n2 = el.n
+    cn1 = el.cp
+    cn2 = el.cn
     # process all the passive elements, save conductance to temp value
-    x = df.loc[i,'element'][0]   #get 1st letter of element name
+    x = el.kind   #get 1st letter of element name
     if x == 'R':
-        g = 1/sympify(df.loc[i,'element'])
+        g = 1/sympify(sym_name(el))
     if x == 'C':
-        g = s*sympify(df.loc[i,'element'])
+        g = s*sympify(sym_name(el))
     if x == 'G':   #vccs type element
-        g = sympify(df.loc[i,'element'].lower())  # use a symbol for gain value
+        g = sympify(sym_name(el).lower())  # use a symbol for gain value
 
     if (x == 'R') or (x == 'C'):
         # If neither side of the element is connected to ground
@@ -350,13 +279,13 @@ print(G)  # display the G matrix
 
 # generate the B Matrix
 sn = 0   # count source number as code walks through the data frame
-for i in range(len(df)):
-    n1 = df.loc[i,'p node']
-    n2 = df.loc[i,'n node']
-    n_vout = df.loc[i,'Vout'] # node connected to op amp output
+for el in elements:
+    n1 = el.p
+    n2 = el.n
+    n_vout = el.vout # node connected to op amp output
 
     # process elements with input to B matrix
-    x = df.loc[i,'element'][0]   #get 1st letter of element name
+    x = el.kind   #get 1st letter of element name
     if x == 'V':
         if i_unk > 1:  #is B greater than 1 by n?, V
             if n1 != 0:
@@ -420,27 +349,25 @@ print(B)   # display the B matrix
 # find the the column position in the C and D matrix for controlled sources
 # needs to return the node numbers and branch number of controlling branch
 def find_vname(name):
-    # need to walk through data frame and find these parameters
-    for i in range(len(df2)):
-        # process all the elements creating unknown currents
-        if name == df2.loc[i,'element']:
-            n1 = df2.loc[i,'p node']
-            n2 = df2.loc[i,'n node']
-            return n1, n2, i  # n1, n2 & col_num are from the branch of the controlling element
-
-    print('failed to find matching branch element in find_vname')
+    try:
+        i = ckt.branch_index(name)
+    except KeyError:
+        print('failed to find matching branch element in find_vname')
+        raise
+    n1, n2 = ckt.branch_nodes[i]
+    return n1, n2, i  # n1, n2 & col_num are from the branch of the controlling element
 
     # generate the C Matrix
 sn = 0   # count source number as code walks through the data frame
-for i in range(len(df)):
-    n1 = df.loc[i,'p node']
-    n2 = df.loc[i,'n node']
-    cn1 = df.loc[i,'cp node'] # nodes for controlled sources
-    cn2 = df.loc[i,'cn node']
-    n_vout = df.loc[i,'Vout'] # node connected to op amp output
+for el in elements:
+    n1 = el.p
+    n2 = el.n
+    cn1 = el.cp # nodes for controlled sources
+    cn2 = el.cn
+    n_vout = el.vout # node connected to op amp output
 
     # process elements with input to B matrix
-    x = df.loc[i,'element'][0]   #get 1st letter of element name
+    x = el.kind   #get 1st letter of element name
     if x == 'V':
         if i_unk > 1:  #is B greater than 1 by n?, V
             if n1 != 0:
@@ -494,19 +421,19 @@ for i in range(len(df)):
                 C[sn,n2-1] = -1
             # add entry for cp and cn of the controlling voltage
             if cn1 != 0:
-                C[sn,cn1-1] = -sympify(df.loc[i,'element'].lower())
+                C[sn,cn1-1] = -sympify(sym_name(el).lower())
             if cn2 != 0:
-                C[sn,cn2-1] = sympify(df.loc[i,'element'].lower())
+                C[sn,cn2-1] = sympify(sym_name(el).lower())
         else:
             if n1 != 0:
                 C[n1-1] = 1
             if n2 != 0:
                 C[n2-1] = -1
-            vn1, vn2, df2_index = find_vname(df.loc[i,'Vname'])
+            vn1, vn2, df2_index = find_vname(el.vname)
             if vn1 != 0:
-                C[vn1-1] = -sympify(df.loc[i,'element'].lower())
+                C[vn1-1] = -sympify(sym_name(el).lower())
             if vn2 != 0:
-                C[vn2-1] = sympify(df.loc[i,'element'].lower())
+                C[vn2-1] = sympify(sym_name(el).lower())
         sn += 1   #increment source count
 
     if x == 'L':
@@ -530,50 +457,50 @@ print(C)   # display the C matrix
 
 # generate the D Matrix
 sn = 0   # count source number as code walks through the data frame
-for i in range(len(df)):
-    n1 = df.loc[i,'p node']
-    n2 = df.loc[i,'n node']
-    #cn1 = df.loc[i,'cp node'] # nodes for controlled sources
-    #cn2 = df.loc[i,'cn node']
-    #n_vout = df.loc[i,'Vout'] # node connected to op amp output
+for el in elements:
+    n1 = el.p
+    n2 = el.n
+    #cn1 = el.cp # nodes for controlled sources
+    #cn2 = el.cn
+    #n_vout = el.vout # node connected to op amp output
 
     # process elements with input to D matrix
-    x = df.loc[i,'element'][0]   #get 1st letter of element name
+    x = el.kind   #get 1st letter of element name
     if (x == 'V') or (x == 'O') or (x == 'E'):  # need to count V, E & O types
         sn += 1   #increment source count
 
     if x == 'L':
         if i_unk > 1:  #is D greater than 1 by 1?
-            D[sn,sn] += -s*sympify(df.loc[i,'element'])
+            D[sn,sn] += -s*sympify(sym_name(el))
         else:
-            D[sn] += -s*sympify(df.loc[i,'element'])
+            D[sn] += -s*sympify(sym_name(el))
         sn += 1   #increment source count
 
     if x == 'H':  # H: ccvs
         # if there is a H type, D is m by m
         # need to find the vn for Vname
         # then stamp the matrix
-        vn1, vn2, df2_index = find_vname(df.loc[i,'Vname'])
-        D[sn,df2_index] += -sympify(df.loc[i,'element'].lower())
+        vn1, vn2, df2_index = find_vname(el.vname)
+        D[sn,df2_index] += -sympify(sym_name(el).lower())
         sn += 1   #increment source count
 
     if x == 'F':  # F: cccs
         # if there is a F type, D is m by m
         # need to find the vn for Vname
         # then stamp the matrix
-        vn1, vn2, df2_index = find_vname(df.loc[i,'Vname'])
-        D[sn,df2_index] += -sympify(df.loc[i,'element'].lower())
+        vn1, vn2, df2_index = find_vname(el.vname)
+        D[sn,df2_index] += -sympify(sym_name(el).lower())
         D[sn,sn] = 1
         sn += 1   #increment source count
 
     if x == 'K':  # K: coupled inductors, KXX LYY LZZ value
         # if there is a K type, D is m by m
-        vn1, vn2, ind1_index = find_vname(df.loc[i,'Lname1'])  # get i_unk position for Lx
-        vn1, vn2, ind2_index = find_vname(df.loc[i,'Lname2'])  # get i_unk position for Ly
+        vn1, vn2, ind1_index = find_vname(el.lname1)  # get i_unk position for Lx
+        vn1, vn2, ind2_index = find_vname(el.lname2)  # get i_unk position for Ly
         # enter sM on diagonals = value*sqrt(LXX*LZZ)
 
-        D[ind1_index,ind2_index] += -s*sympify('M{:s}'.format(df.loc[i,'element'].lower()[1:]))  # s*Mxx
-        D[ind2_index,ind1_index] += -s*sympify('M{:s}'.format(df.loc[i,'element'].lower()[1:]))  # -s*Mxx
+        D[ind1_index,ind2_index] += -s*sympify('M{:s}'.format(sym_name(el).lower()[1:]))  # s*Mxx
+        D[ind2_index,ind1_index] += -s*sympify('M{:s}'.format(sym_name(el).lower()[1:]))  # -s*Mxx
 
 # display the The D matrix
 print(D)
@@ -587,20 +514,21 @@ print(V)  # display the V matrix
 # The J matrix is an mx1 matrix, with one entry for each i_unk from a source
 #sn = 0   # count i_unk source number
 #oan = 0   #count op amp number
-for i in range(len(df2)):
+branch_els = [el for el in elements if el.kind in BRANCH_TYPES]
+for i in range(len(branch_els)):
     # process all the unknown currents
-    J[i] = sympify('I_{:s}'.format(df2.loc[i,'element']))
+    J[i] = sympify('I_{:s}'.format(sym_name(branch_els[i])))
 
 print(J)  # diplay the J matrix
 
 # generate the I matrix, current sources have n2 = arrow end of the element
-for i in range(len(df)):
-    n1 = df.loc[i,'p node']
-    n2 = df.loc[i,'n node']
+for el in elements:
+    n1 = el.p
+    n2 = el.n
     # process all the passive elements, save conductance to temp value
-    x = df.loc[i,'element'][0]   #get 1st letter of element name
+    x = el.kind   #get 1st letter of element name
     if x == 'I':
-        g = sympify(df.loc[i,'element'])
+        g = sympify(sym_name(el))
         # sum the current into each node
         if n1 != 0:
             I[n1-1] -= g
@@ -611,11 +539,11 @@ print(I)  # display the I matrix
 
 # generate the E matrix
 sn = 0   # count source number
-for i in range(len(df)):
+for el in elements:
     # process all the passive elements
-    x = df.loc[i,'element'][0]   #get 1st letter of element name
+    x = el.kind   #get 1st letter of element name
     if x == 'V':
-        Ev[sn] = sympify(df.loc[i,'element'])
+        Ev[sn] = sympify(sym_name(el))
         sn += 1
 
 print(Ev)   # display the E matrix
@@ -686,7 +614,8 @@ for k, v in element_values.items():
 # Add missing substitutions for remaining symbols
 element_values['ea1'] = 2.0  # Example numerical value for 'ea1'
 element_values['f1'] = 2.0   # Example numerical value for 'f1'
-element_values['s']=1
+# the operating point is the DC solution, s = 0 as in numeric mode
+element_values['s']=0
 # Add this after your element_values dictionary is populated but before the matrix conversion
 
 # def evaluate_matrix_at_frequency(A, Z, element_values, frequency=0):
@@ -768,22 +697,38 @@ element_values['s']=1
 
 # Re-substitute and evaluate
 A_num = A.subs(element_values).evalf()
-Z_num = Matrix(Z).subs(element_values).evalf()
-
-
 
 # Convert to NumPy
 
 A_np = np.array(A_num.tolist(), dtype=float)
-Z_np = np.array(Z_num.tolist(), dtype=float).flatten()
+
+# Z is linear in the independent sources, Z = S*u
+# u holds one column per excitation, the netlist values are the first one
+sources = [sympify(el.name) for el in elements if el.kind in ('V', 'I')]
+S_np = source_incidence(Z, sources)
+u_np = np.array([element_values[str(src)] for src in sources], dtype=float)
 
 # Define a list to track symbolic solutions for X
 symbolic_X = []
 
-# Solve the system
-X_np = np.linalg.solve(A_np, Z_np)
-
-# For each symbolic solution, print both the symbolic expression and its numeric value
-for i, val in enumerate(X_np):
-    symbolic_var = f"X[{i}] = {sp.symbols(f'v{i+1}')}"  # Create symbolic representation
-    print(f" {val:.4f} ")
\ No newline at end of file
+# Solve the system, A is factored once and can be reused for more excitations
+try:
+    lu = Factorization(A_np)
+    X_np = solve_excitations(A_np, S_np, u_np, lu=lu)[:,0]
+except np.linalg.LinAlgError as e:
+    # e.g. a node without a DC path to ground, the directives below can still run
+    print('error: operating point failed: {}'.format(e))
+else:
+    # For each symbolic solution, print both the symbolic expression and its numeric value
+    for i, val in enumerate(X_np):
+        symbolic_var = f"X[{i}] = {sp.symbols(f'v{i+1}')}"  # Create symbolic representation
+        print(f" {val:.4f} ")
+
+    # full precision copy of the operating point when RESULTS_DIR is set, the
+    # printed values above are rounded to 4 decimals
+    run_id = save_operating_point(ckt.unknown_names, X_np)
+    if run_id is not None:
+        print('results: op {:s}'.format(run_id))
+
+# analyses requested by directives such as .sens
+run_directives(ckt)
@@ -0,0 +1,16 @@
+from analyses import run_directives
+from circuit import Circuit
+
+RC = ['V1 1 0 1', 'R1 1 2 1e3', 'C1 2 0 1e-9']
+
+
+def test_bad_directives_print_one_line_errors(capsys):
+    directives = [['.sens', 'v(9)'], ['.sens', 'v(2)', 'ac', 'dec', '10'],
+                  ['.pz', 'v1', 'v(2)', 'sparse', '1', '-1000000'], ['.sens', 'v(2)']]
+    ckt = Circuit.from_lines(RC, directives)
+    results = run_directives(ckt)
+    out = capsys.readouterr().out
+    assert [name for name, _ in results] == ['.sens', '.sens', '.pz', '.sens']
+    assert [res is None for _, res in results] == [True, True, True, False]
+    assert out.count('error: ') == 3
+    assert 'unknown node 9' in out
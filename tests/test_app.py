@@ -0,0 +1,100 @@
+import json
+import os
+import signal
+
+import pytest
+
+
+@pytest.fixture
+def app_module(monkeypatch, tmp_path):
+    # importing app defaults RESULTS_DIR, keep the results of the tests out of the tree
+    monkeypatch.setenv('RESULTS_DIR', str(tmp_path / 'results'))
+    import app
+    return app
+
+
+def netlist(tmp_path):
+    path = tmp_path / 'circuit.net'
+    path.write_text('V1 1 0 1\nR1 1 2 1\nR2 2 0 1\n')
+    return str(path)
+
+
+def test_pool_recovers_from_a_dead_worker(app_module, tmp_path):
+    pool = app_module.SolverPool(1)
+    try:
+        pid = pool.executor.submit(os.getpid).result()
+        os.kill(pid, signal.SIGKILL)
+        with pytest.raises(Exception, match='restarted'):
+            pool.run(netlist(tmp_path), 'numeric')
+        code, out, err = pool.run(netlist(tmp_path), 'numeric')
+        assert code == 0 and ' 0.5000 ' in out, err
+    finally:
+        pool.shutdown()
+
+
+def test_pool_times_out_a_slow_solve(app_module, tmp_path, monkeypatch):
+    script = tmp_path / 'slow.py'
+    script.write_text('import time\ntime.sleep(30)\n')
+    monkeypatch.setattr(app_module, 'SOLVER_SCRIPT', str(script))
+    pool = app_module.SolverPool(1, timeout=0.5)
+    try:
+        code, out, err = pool.run(netlist(tmp_path), 'numeric')
+        assert code == 1 and 'timed out' in err
+    finally:
+        pool.shutdown()
+
+
+def batch(client, items, ordered=False, ndjson=False):
+    url = '/process-netlists' + ('?ordered=1' if ordered else '')
+    if ndjson:
+        resp = client.post(url, data='\n'.join(json.dumps(it) for it in items) + '\n',
+                           content_type='application/x-ndjson')
+    else:
+        resp = client.post(url, json=items)
+    assert resp.status_code == 200
+    return [json.loads(ln) for ln in resp.get_data(as_text=True).splitlines()]
+
+
+def divider(r2):
+    return {'netlist': 'V1 1 0 1\nR1 1 2 1\nR2 2 0 {}'.format(r2), 'mode': 'numeric', 'diagram': False}
+
+
+BATCH = [divider(1), {'netlist': 'V1 1 0 1\nV2 1 0 2', 'mode': 'numeric', 'diagram': False},
+         {'mode': 'numeric'}, divider(3), {'netlist': 'V1 1 0 1', 'mode': 'fast'}, divider(1)]
+
+
+def check_batch(lines):
+    by_index = {ln['index']: ln for ln in lines}
+    assert sorted(by_index) == list(range(len(BATCH)))
+    # v2 of the dividers, identical items share one solve
+    assert ' 0.5000 ' in by_index[0]['results']['output']
+    assert ' 0.7500 ' in by_index[3]['results']['output']
+    assert by_index[5]['results'] == by_index[0]['results']
+    assert by_index[0]['topology'] == by_index[3]['topology'] != by_index[1]['topology']
+    # per item errors: preflight (a loop of voltage sources), missing netlist, unknown mode
+    assert by_index[1]['status'] == 'error'
+    assert by_index[1]['diagnostics'][0]['code'] == 'voltage-loop'
+    assert by_index[2] == {'index': 2, 'topology': None, 'status': 'error',
+                           'message': 'No netlist content provided'}
+    assert by_index[4]['message'] == 'Unknown analysis mode: fast'
+    # diagram: false skips the drawing
+    assert by_index[0]['circuitDiagram'] is None
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_batch_ordered(app_module, ndjson):
+    lines = batch(app_module.app.test_client(), BATCH, ordered=True, ndjson=ndjson)
+    assert [ln['index'] for ln in lines] == list(range(len(BATCH)))
+    check_batch(lines)
+
+
+def test_batch_unordered(app_module):
+    lines = batch(app_module.app.test_client(), BATCH)
+    # invalid items are answered first, before any solve finishes
+    assert {ln['index'] for ln in lines[:2]} == {2, 4}
+    check_batch(lines)
+
+
+def test_batch_rejects_a_non_array(app_module):
+    resp = app_module.app.test_client().post('/process-netlists', json={'netlist': 'V1 1 0 1'})
+    assert resp.status_code == 400
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import dcsweep
+from circuit import Circuit
+from dcsweep import dc_sweep, sweep_values
+from mna import Factorization
+
+NET = ['V1 1 0 1', 'R1 1 2 1e3', 'R2 2 0 2e3', 'G1 3 0 2 0 1e-3', 'R3 3 0 1e3',
+       'E1 4 0 3 0 2', 'R4 4 5 1e3', 'R5 5 0 1e3', 'F1 6 0 V1 0.5', 'R6 6 0 1e3',
+       'H1 7 0 V1 100', 'R7 7 0 1e3', 'I1 0 5 1e-3']
+
+
+def direct(values):
+    # one full solve with the given element values
+    lines = [' '.join(ln.split()[:-1] + [repr(float(values[ln.split()[0]]))]) if ln.split()[0] in values else ln
+             for ln in NET]
+    system = Circuit.from_lines(lines).stamp()
+    return Factorization(system.G).solve(system.Z())
+
+
+def check(sweeps, refactored=None):
+    res = dc_sweep(Circuit.from_lines(NET), sweeps)
+    assert res.X.shape[1] == np.prod(res.shape)
+    for i in range(len(res)):
+        point = {name: res.values[k, i] for k, name in enumerate(res.params)}
+        assert np.allclose(res.X[:, i], direct(point), rtol=1e-9, atol=1e-12)
+    if refactored is not None:
+        assert res.refactored == refactored
+    return res
+
+
+@pytest.mark.parametrize('name, values', [('R1', [100, 500, 2e3, 1e5]), ('G1', [-2e-3, 0, 1e-3, 5e-3]),
+                                          ('E1', [-3, 0, 1, 10]), ('F1', [-1, 0, 0.5, 4]),
+                                          ('H1', [-200, 0, 100, 1e3])])
+def test_element_sweeps_match_direct_solves(name, values):
+    check([(name, values)], refactored=0)
+
+
+def test_nested_source_and_element_sweep():
+    res = check([('V1', sweep_values(-1, 1, 0.5)), ('R2', [500, 1e3, 4e3])])
+    assert res.shape == (3, 5)
+    check([('H1', [10, 100]), ('I1', [0, 1e-3, 2e-3])])
+    check([('R1', [200, 2e3]), ('E1', [1, 3])])
+
+
+def test_refactor_fallback_matches(monkeypatch):
+    # every point fails the residual check and gets its own LU
+    monkeypatch.setattr(dcsweep, 'RESIDUAL_TOL', 0.0)
+    check([('R2', [500, 1e3, 4e3]), ('V1', [0, 1])], refactored=6)
+
+
+def test_resistor_through_zero_is_nan_without_warnings(recwarn):
+    # R2 and R4 hang off the ideal source, so W.T*A0^-1*U has zeros that meet D = inf
+    ckt = Circuit.from_lines(['V1 1 0 1', 'R1 1 2 1', 'R2 2 0 1', 'R3 1 3 1', 'R4 3 0 1'])
+    res = dc_sweep(ckt, [('R2', sweep_values(-1, 1, 0.5)), ('R4', [1, 2])])
+    v2 = res.column('v2').reshape(res.shape)
+    assert np.isnan(v2[:, [0, 2]]).all()
+    assert np.allclose(v2[:, [1, 3, 4]], [-1, 1 / 3, 0.5])
+    assert np.allclose(res.column('v3').reshape(res.shape)[:, 3], [0.5, 2 / 3])
+    assert not [w for w in recwarn if issubclass(w.category, RuntimeWarning)]
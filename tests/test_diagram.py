@@ -0,0 +1,39 @@
+import os
+import time
+
+import diagram
+from diagram import DiagramRenderer
+
+
+def chain(k):
+    # a different topology for every k, small enough for the in process svg writer
+    return '\n'.join('R{:d} {:d} {:d} 1'.format(j, j, j + 1) for j in range(1, k + 2))
+
+
+def test_cache_keeps_most_recently_used(tmp_path):
+    r = DiagramRenderer(str(tmp_path), keep=3, max_age=0, min_age=0)
+    names = []
+    for k in range(5):
+        names.append(r.submit(chain(k), 'svg'))
+        assert r.wait(names[-1]) == 'ready'
+        old = time.time() - 100 + k
+        os.utime(os.path.join(str(tmp_path), names[-1]), (old, old))
+    assert sorted(nm for _, nm in r.files()) == sorted(names[2:])
+    # a cache hit counts as a use, names[3] is now the least recently used
+    assert r.submit(chain(2), 'svg') == names[2]
+    names.append(r.submit(chain(5), 'svg'))
+    r.wait(names[-1])
+    assert sorted(nm for _, nm in r.files()) == sorted([names[2], names[4], names[5]])
+
+
+def test_failed_renders_are_bounded(tmp_path, monkeypatch):
+    def broken(edges):
+        raise RuntimeError('no layout')
+    monkeypatch.setattr(diagram, 'render_svg', broken)
+    monkeypatch.setattr(diagram, 'MAX_FAILED', 4)
+    r = DiagramRenderer(str(tmp_path), max_workers=1)
+    names = [r.submit(chain(k), 'svg') for k in range(10)]
+    for nm in names:
+        r.wait(nm)
+    assert list(r.failed) == names[-4:]
+    assert r.status(names[0]) == 'missing' and r.status(names[-1]) == 'failed'
@@ -0,0 +1,40 @@
+import numpy as np
+
+from analyses import run_directives
+from circuit import Circuit
+from mna import Factorization, impedance_matrix, solve_excitations
+
+# T network, port 1 between node 1 and ground, port 2 between node 3 and ground
+T_NET = ['I1 1 0 0', 'R1 1 2 100', 'R2 2 0 50', 'R3 2 3 200']
+
+
+def test_complex_excitations_keep_imaginary_part():
+    system = Circuit.from_lines(['V1 1 0 1', 'R1 1 2 1e3', 'C1 2 0 1e-9', 'I1 2 0 1e-3']).stamp()
+    U = np.array([[1.0 + 0.5j], [2e-3j]])
+    # complex system, and a real factorization given as lu
+    for A, lu in ((system.A(2j * np.pi * 1e5), None), (system.A(), Factorization(system.A()))):
+        X = solve_excitations(A, system.S, U, lu)
+        expected = solve_excitations(A, system.S, U.real, lu) + 1j * solve_excitations(A, system.S, U.imag, lu)
+        assert np.iscomplexobj(X)
+        assert np.allclose(X, expected)
+
+
+def test_impedance_matrix_of_t_network():
+    system = Circuit.from_lines(T_NET).stamp()
+    Z = impedance_matrix(system.A(), [(1, 0), (3, 0)])
+    assert np.allclose(Z, [[150, 50], [50, 250]])
+
+
+def test_impedance_matrix_ac():
+    system = Circuit.from_lines(['I1 1 0 0', 'R1 1 0 1e3', 'C1 1 0 1e-9']).stamp()
+    w = 2 * np.pi * 1e5
+    Z = impedance_matrix(system.A(1j * w), [(1, 0)])
+    assert np.allclose(Z, 1 / (1e-3 + 1j * w * 1e-9))
+
+
+def test_zparams_directive(capsys):
+    ckt = Circuit.from_lines(T_NET, [['.zparams', '1', '0', '3', '0'], ['.zparams', '1', '0', '9', '0']])
+    (_, Z), (_, bad) = run_directives(ckt)
+    out = capsys.readouterr().out
+    assert np.allclose(Z, [[150, 50], [50, 250]])
+    assert bad is None and 'unknown node 9' in out
@@ -0,0 +1,32 @@
+import numpy as np
+
+from circuit import Circuit
+from mor import prima
+
+
+def rlc_line(sections, r, l, c):
+    """Series R-L sections with a capacitor to ground after each one."""
+    lines = []
+    for k in range(sections):
+        a, m, b = 2 * k + 1, 2 * k + 2, 2 * k + 3
+        lines += ['R{:d} {:d} {:d} {}'.format(k + 1, a, m, r),
+                  'L{:d} {:d} {:d} {}'.format(k + 1, m, b, l),
+                  'C{:d} {:d} 0 {}'.format(k + 1, b, c)]
+    return lines
+
+
+def test_prima_meets_tol_with_interconnect_values():
+    # pH / fF sections, the Krylov blocks are far below 1 in norm
+    ckt = Circuit.from_lines(rlc_line(500, 0.5, 1e-11, 1e-14))
+    model = prima(ckt, [1, 1001], tol=1e-3, fmax=1e9)
+    assert model.converged
+    assert model.error <= 1e-3
+    assert model.size < ckt.stamp().size // 10
+
+
+def test_prima_flags_unmet_tol():
+    ckt = Circuit.from_lines(rlc_line(50, 0.1, 1e-9, 1e-12))
+    model = prima(ckt, [1, 101], tol=1e-12, fmax=1e9, max_moments=2)
+    assert not model.converged
+    assert model.error > 1e-12
+    assert np.isfinite(model.error)
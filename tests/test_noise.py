@@ -0,0 +1,58 @@
+import numpy as np
+
+import noise as noise_module
+from analyses import run_directives
+from circuit import Circuit
+from mna import Factorization, sweep_frequencies
+from noise import BOLTZMANN, TEMP, adjoint_solutions, noise, noise_sources
+from resultstore import ResultStore
+
+RC = ['V1 1 0 0', 'R1 1 2 1e3', 'C1 2 0 1e-9']
+AMP = ['V1 1 0 1', 'R1 1 2 1e3', 'C1 2 0 1e-9', 'L1 2 3 1e-3', 'R2 3 0 50',
+       'E1 4 0 3 0 2', 'R3 4 5 1e3', 'C2 5 0 1e-12', 'G1 0 6 5 0 1e-3', 'R4 6 0 1e3']
+
+
+def test_rc_lowpass_integrates_to_kt_over_c():
+    freqs = sweep_frequencies('dec', 50, 1, 1e12)
+    res = noise(Circuit.from_lines(RC), 'v(2)', 'v1', freqs)
+    total, parts = res.integrated()
+    assert np.isclose(total, BOLTZMANN * TEMP / 1e-9, rtol=1e-3)
+    # the source is the input, the output is referred back through |H|^2
+    assert np.allclose(res.input_psd * np.abs(res.gain) ** 2, res.output_psd)
+
+
+def test_dense_and_sparse_adjoint_solutions_agree(monkeypatch):
+    system = Circuit.from_lines(AMP).stamp()
+    e = system.output_vector('v(6)')
+    freqs = sweep_frequencies('dec', 5, 10, 1e9)
+    dense = adjoint_solutions(system, e, freqs)
+    monkeypatch.setattr(noise_module, 'DENSE_LIMIT', 0)
+    sparse = adjoint_solutions(system, e, freqs)
+    assert np.allclose(dense, sparse, rtol=1e-10, atol=1e-14)
+
+
+def test_transfers_match_forward_solves():
+    ckt = Circuit.from_lines(AMP)
+    system = ckt.stamp()
+    specs = {'E1': (1e-8, 1e3), 'G1': (1e-11, 0.0)}
+    freqs = np.array([1e3, 1e6])
+    res = noise(ckt, 'v(6)', 'v1', freqs, specs, system)
+    names, Ninc, psd = noise_sources(ckt, system, specs)
+    e = system.output_vector('v(6)')
+    for f, fk in enumerate(freqs):
+        lu = Factorization(system.A(2j * np.pi * fk))
+        T = e @ lu.solve(Ninc.toarray())
+        assert np.allclose(res.psd[f], np.abs(T) ** 2 * psd(freqs)[f], rtol=1e-9)
+        gain = e @ lu.solve(system.S[:, system.sources.index('V1')].toarray().ravel())
+        assert np.isclose(res.gain[f], gain)
+
+
+def test_stored_noise_columns_are_psds(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('RESULTS_DIR', str(tmp_path))
+    ckt = Circuit.from_lines(RC, [['.noise', 'v(2)', 'v1', 'dec', '2', '1e3', '1e5']])
+    (_, res), = run_directives(ckt)
+    run_id = capsys.readouterr().out.split('results: noise ')[1].split()[0]
+    data = ResultStore(str(tmp_path)).open(run_id)
+    assert data.columns == ['freq', 'onoise_psd', 'inoise_psd', 'R1_psd']
+    assert data.meta['attrs']['units']['onoise_psd'] == 'V^2/Hz'
+    assert np.allclose(data.column('onoise_psd'), res.output_psd)
@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+import partition
+from circuit import Circuit
+from partition import PartitionedSolver, partition_system
+
+
+def ladder(sections):
+    lines = ['V1 1 0 1']
+    for k in range(1, sections + 1):
+        lines += ['R{} {} {} 10'.format(k, k, k + 1), 'RG{} {} 0 1e3'.format(k, k + 1)]
+    return Circuit.from_lines(lines)
+
+
+def _fail_back(conn, blocks):
+    # eliminates, then fails in the back substitution
+    conn.send(('ok', [partition._eliminate(bl)[1:] for bl in blocks]))
+    conn.recv()
+    conn.send(('error', 'RuntimeError: back substitution failed'))
+    conn.close()
+
+
+def _die(conn, blocks):
+    os._exit(1)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+@pytest.mark.parametrize('worker', [None, _fail_back, _die])
+def test_failed_worker_falls_back(monkeypatch, worker):
+    ckt = ladder(40)
+    system = ckt.stamp()
+    A, b = system.A(), system.Z()
+    if worker is not None:
+        monkeypatch.setattr(partition, '_domain_worker', worker)
+    solver = PartitionedSolver(A, partition_system(ckt, A, 4), workers=2)
+    x = solver.solve(b)
+    assert np.abs(A @ x - b).max() < 1e-12
+    assert (solver.stats['fallback'] is None) == (worker is None)
+    assert solver.procs == [] and not multiprocessing.active_children()
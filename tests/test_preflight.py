@@ -0,0 +1,64 @@
+import pytest
+
+from bench import ladder_netlist, mesh_netlist
+from preflight import has_errors, preflight
+
+
+def codes(lines):
+    ckt, diags = preflight(lines)
+    return [(d.severity, d.code, d.element, d.node) for d in diags]
+
+
+@pytest.mark.parametrize('lines, expected', [
+    (['V1 1 0 1', 'R1 1 0 1', 'R2 2 3 1'], ('error', 'floating-node', 'R2', 2)),
+    (['V1 1 0 1', 'R1 1 0 1', 'I1 2 0 1', 'R2 2 3 1'], ('error', 'current-source-cutset', 'I1', 2)),
+    # the op amp output and E1 both fix node 3
+    (['V1 1 0 1', 'R1 1 2 1', 'O1 2 0 3', 'E1 3 0 1 0 2', 'R2 3 0 1'], ('error', 'voltage-loop', 'O1', 3)),
+    (['V1 1 0 1', 'V2 1 0 2'], ('error', 'voltage-loop', 'V2', 1)),
+    (['V1 1 0 1', 'L1 1 2 1e-3', 'L2 2 0 1e-3'], ('warning', 'inductor-loop', 'L2', 2)),
+    (['V1 1 0 1', 'R1 1 0 1', 'F1 1 0 VX 2'], ('error', 'unknown-reference', 'F1', None)),
+    (['V1 1 0 1', 'R1 1 0 1', 'H1 2 0 VX 2', 'R2 2 0 1'], ('error', 'unknown-reference', 'H1', None)),
+    # K refers to an inductor that does not exist, or to an element that is not an inductor
+    (['V1 1 0 1', 'R1 1 2 1', 'L1 2 0 1e-3', 'K1 L1 L9 0.5'], ('error', 'unknown-reference', 'K1', None)),
+    (['V1 1 0 1', 'R1 1 2 1', 'L1 2 0 1e-3', 'K1 L1 R1 0.5'], ('error', 'unknown-reference', 'K1', None)),
+    (['V1 1 0 1', 'R1 1 2 1', 'L1 2 0 1e-3', 'L2 2 0 1e-3', 'K1 L1 L2 1.5'],
+     ('warning', 'coupling-range', 'K1', None)),
+    (['V1 1 0 1', 'R1 1 3 1', 'R2 3 0 1'], ('error', 'missing-node', None, 2)),
+    (['V1 1 0 1', 'R1 1 0 1', 'R1 1 0 2'], ('error', 'duplicate-name', 'R1', None)),
+    (['V1 1 0 1', 'R1 1 2 1', 'C1 2 3 1e-6', 'C2 3 0 1e-6'], ('warning', 'no-dc-path', 'C1', 3)),
+])
+def test_each_diagnostic(lines, expected):
+    assert expected in codes(lines)
+
+
+def test_problems_are_reported_once_per_group():
+    # nodes 2, 3 and 4 float together
+    found = codes(['V1 1 0 1', 'R1 1 0 1', 'R2 2 3 1', 'R3 3 4 1'])
+    assert found == [('error', 'floating-node', 'R2', 2)]
+
+
+@pytest.mark.parametrize('lines', [
+    ['V1 1 0 1', 'R1 1 2 1e3', 'R2 2 3 1e4', 'O1 0 2 3'],
+    ['V1 1 0 1', 'R1 1 2 1', 'L1 2 0 1e-3', 'L2 3 0 1e-3', 'R2 3 0 50', 'K1 L1 L2 0.9'],
+    ['V1 1 0 1', 'R1 1 0 1', 'F1 2 0 V1 2', 'R2 2 0 1', 'H1 3 0 V1 10', 'R3 3 0 1',
+     'G1 4 0 1 0 1e-3', 'R4 4 0 1', 'E1 5 0 4 0 2', 'R5 5 0 1', 'I1 0 4 1e-3'],
+    # a source between two nodes, a capacitor across a source, a current source across a resistor
+    ['V1 1 2 1', 'R1 1 0 1', 'R2 2 0 1', 'C1 1 2 1e-9', 'I1 0 2 1e-3'],
+    # L in series with a source and a series RLC
+    ['V1 1 0 1', 'L1 1 2 1e-3', 'R1 2 3 10', 'C1 3 0 1e-9', 'R2 3 0 1e6'],
+    ladder_netlist(50),
+    mesh_netlist(8),
+])
+def test_valid_netlists_pass_cleanly(lines):
+    ckt, diags = preflight(lines)
+    assert ckt is not None
+    assert diags == []
+    assert not has_errors(diags)
+
+
+@pytest.mark.parametrize('line, code', [('X1 1 0 1', 'unknown-element'), ('R2 1 0', 'bad-format'),
+                                        ('R2 1 a 1', 'bad-node'), ('R2 1 0 1k', 'bad-value')])
+def test_line_errors_stop_before_parsing(line, code):
+    ckt, diags = preflight(['V1 1 0 1', 'R1 1 0 1', line])
+    assert ckt is None
+    assert [d.code for d in diags] == [code]
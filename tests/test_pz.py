@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from bench import ladder_netlist, mesh_netlist
+from circuit import Circuit
+from pz import pole_zero
+
+RLCEG = ['V1 1 0 1', 'R1 1 2 50', 'L1 2 3 1e-6', 'C1 3 0 1e-9', 'E1 4 0 3 0 2', 'R2 4 5 1e3',
+         'C2 5 0 1e-12', 'G1 0 6 5 0 1e-3', 'R3 6 0 1e3', 'L2 6 7 1e-3', 'R4 7 0 10']
+
+
+def nearest(vals, count):
+    return np.sort_complex(vals[np.argsort(np.abs(vals))][:count])
+
+
+@pytest.mark.parametrize('lines, output, k', [(ladder_netlist(450), 'v(451)', 6),
+                                              (mesh_netlist(21), 'v(200)', 6),
+                                              (RLCEG, 'v(7)', 8)])
+def test_sparse_matches_dense(lines, output, k):
+    system = Circuit.from_lines(lines).stamp()
+    dense = pole_zero(system, 'v1', output, 'dense')
+    sparse = pole_zero(system, 'v1', output, 'sparse', k)
+    # sparse finds the k values closest to the shift, there are no others
+    assert len(sparse.poles) == min(k, len(dense.poles))
+    assert len(sparse.zeros) == min(k, len(dense.zeros))
+    assert np.allclose(np.sort_complex(sparse.poles), nearest(dense.poles, len(sparse.poles)), rtol=1e-6)
+    assert np.allclose(np.sort_complex(sparse.zeros), nearest(dense.zeros, len(sparse.zeros)), rtol=1e-6)
+
+
+def test_ladder_default_method_has_no_zeros():
+    system = Circuit.from_lines(ladder_netlist(450)).stamp()
+    assert system.size > 400
+    res = pole_zero(system, 'v1', 'v(451)')
+    assert len(res.zeros) == 0 and res.stable
+
+
+def test_hidden_pole_is_not_dominant():
+    # the pole at 0 (charge on node 3) is cancelled by a zero at 0
+    system = Circuit.from_lines(['V1 1 0 1', 'R1 1 2 1', 'C1 2 3 1e-6', 'C2 3 0 1e-6']).stamp()
+    res = pole_zero(system, 'v1', 'v(3)', 'dense')
+    assert np.allclose(res.hidden, [0])
+    assert np.isclose(res.dominant, -2e6)
+    assert res.stable and not res.marginal
@@ -0,0 +1,52 @@
+import os
+import resource
+import time
+
+import numpy as np
+
+from resultstore import ResultStore
+
+
+def test_many_columns_below_open_file_limit(tmp_path):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(256, hard), hard))
+    try:
+        store = ResultStore(str(tmp_path))
+        names = ['v{:d}'.format(k) for k in range(2000)]
+        with store.create([(nm, float) for nm in names]) as w:
+            for _ in range(2):
+                w.append({nm: np.arange(3.0) + k for k, nm in enumerate(names)})
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    rs = store.open(w.run_id)
+    assert rs.rows == 6
+    assert np.array_equal(rs.column('v1999'), np.tile(np.arange(3.0) + 1999, 2))
+
+
+def test_prune_keeps_newest_runs(tmp_path):
+    store = ResultStore(str(tmp_path), keep=3, max_age=0, min_age=0)
+    ids = []
+    for k in range(5):
+        with store.create([('v1', float)]) as w:
+            w.append({'v1': [float(k)]})
+        ids.append(w.run_id)
+    kept = [run_id for _, run_id in store.runs()]
+    assert len(kept) == 3
+    assert ids[-1] in kept
+
+
+def test_prune_spares_young_runs(tmp_path):
+    # a batch larger than keep, its runs are all still being read
+    store = ResultStore(str(tmp_path), keep=3, max_age=0, min_age=600)
+    ids = []
+    for k in range(10):
+        with store.create([('v1', float)]) as w:
+            w.append({'v1': [float(k)]})
+        ids.append(w.run_id)
+    assert sorted(run_id for _, run_id in store.runs()) == sorted(ids)
+    # once they are old the count applies again
+    old = time.time() - 601
+    for run_id in ids:
+        os.utime(os.path.join(str(tmp_path), run_id, 'meta.json'), (old, old))
+    store.prune()
+    assert len(store.runs()) == 3
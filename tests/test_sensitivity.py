@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from circuit import Circuit
+from sensitivity import sensitivities
+
+NET = ['V1 1 0 1', 'R1 1 2 1e3', 'C1 2 0 1e-9', 'L1 2 3 1e-3', 'R2 3 0 50',
+       'E1 4 0 3 0 2', 'R3 4 0 1e3']
+
+
+@pytest.mark.parametrize('freqs', [None, [1e3, 1e5]])
+def test_sensitivities_match_finite_differences(freqs):
+    ckt = Circuit.from_lines(NET)
+    res = sensitivities(ckt, ['v(4)'], freqs)
+    for j, name in enumerate(res.params):
+        if name == 'V1':
+            continue
+        h = 1e-6 * res.values[j]
+        lines = [' '.join(ln.split()[:-1] + [repr(float(res.values[j] + h))]) if ln.split()[0] == name else ln
+                 for ln in NET]
+        shifted = sensitivities(Circuit.from_lines(lines), ['v(4)'], freqs)
+        fd = (shifted.y[:, 0] - res.y[:, 0]) / h
+        assert np.allclose(res.dy[:, j, 0], fd, rtol=1e-4, atol=1e-12)
@@ -0,0 +1,41 @@
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VALUE = re.compile(r'^ (-?\d+\.\d{4}) $')
+
+
+def run(tmp_path, lines, mode):
+    path = tmp_path / 'circuit.net'
+    path.write_text('\n'.join(lines) + '\n')
+    env = dict(os.environ, NETLIST_PATH=str(path), ANALYSIS_MODE=mode)
+    env.pop('RESULTS_DIR', None)
+    proc = subprocess.run([sys.executable, 'server2.py'], cwd=ROOT, env=env, capture_output=True, text=True)
+    values = [float(m.group(1)) for m in map(VALUE.match, proc.stdout.splitlines()) if m]
+    return proc, values
+
+
+def test_modes_agree_on_reactive_circuit(tmp_path):
+    lines = ['V1 1 0 1', 'R1 1 2 1', 'C1 2 0 1', 'L1 2 3 1e-3', 'R2 3 0 2']
+    _, numeric = run(tmp_path, lines, 'numeric')
+    _, symbolic = run(tmp_path, lines, 'symbolic')
+    # DC point, C1 open and L1 shorted
+    assert np.allclose(numeric[:3], [1, 2 / 3, 2 / 3], atol=1e-4)
+    assert numeric == symbolic
+
+
+@pytest.mark.parametrize('mode', ['numeric', 'symbolic'])
+def test_singular_operating_point_still_runs_directives(tmp_path, mode):
+    # node 3 and 4 have no DC path to ground, preflight only warns
+    lines = ['V1 1 0 1', 'R1 1 2 1', 'C1 2 3 1e-6', 'R2 3 4 1', 'C2 4 0 1e-6', '.pz v1 v(4)']
+    proc, values = run(tmp_path, lines, mode)
+    assert proc.returncode == 0, proc.stderr
+    assert 'Traceback' not in proc.stderr
+    assert 'error: operating point failed' in proc.stdout
+    assert 'dominant pole: -1e+06+0j' in proc.stdout
+    assert values == []